@@ -4,25 +4,69 @@ API REST para búsqueda de productos SEPA.
 Este módulo expone endpoints HTTP para consultar información de productos
 del Sistema de Precios de Argentina (SEPA) mediante código de barras.
 """
-import sys
 import os
-
-# Agregar el directorio raíz al path para importar módulos
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from flask import Flask, Blueprint, jsonify, request
+import hashlib
+import hmac
+import re
+import threading
+from flask import Flask, Blueprint, Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
+import orjson
+import redis
+from cachetools import TTLCache
 from functools import wraps
-from app.models import BuscadorProductos
-from config import API_KEY
+from app.models import BuscadorProductos, LoteadorBusquedas
+from config import API_KEY, LOTE_VENTANA_MS, LOTE_MAXIMO, REDIS_URL, CACHE_TTL
+
+
+class ProveedorJSONOrjson(DefaultJSONProvider):
+    """Proveedor JSON de Flask que serializa con orjson.
+
+    Reemplaza al módulo json estándar en jsonify y en request.get_json. Los
+    tipos que orjson no soporta (por ejemplo Decimal) se delegan al default
+    de Flask.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default),
+            mimetype=self.mimetype
+        )
+
 
 app = Flask(__name__)
+app.json = ProveedorJSONOrjson(app)
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 500
+app.config['COMPRESS_LEVEL'] = 6
 CORS(app)
+Compress(app)
 
 # Crear Blueprint con prefijo /api/v1
 api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
 
 buscador = BuscadorProductos()
+loteador = LoteadorBusquedas(buscador, LOTE_VENTANA_MS, LOTE_MAXIMO) if LOTE_VENTANA_MS > 0 else None
+
+redis_cliente = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
+_PREFIJO_REDIS = 'sepa:'
+
+_CUERPO_OK = b'{"status":"ok"}'
+_PLANTILLA_NO_ENCONTRADO = b'{"error":"Producto no encontrado","id_producto":%s}'
+
+_PATRON_CODIGO_BARRAS = re.compile(r'[0-9]{8,14}')
+
+_API_KEY_BYTES = API_KEY.encode('utf-8') if API_KEY else None
+_BEARER_API_KEY = f'Bearer {API_KEY}'.encode('utf-8') if API_KEY else None
 
 
 def requiere_api_key(f):
@@ -30,7 +74,8 @@ def requiere_api_key(f):
 
     Valida que las solicitudes incluyan un token Bearer válido en el header
     Authorization. Si el token no es válido o no se proporciona, retorna
-    un error HTTP apropiado.
+    un error HTTP apropiado. El caso habitual (header "Bearer <API_KEY>") se
+    resuelve con una única comparación en tiempo constante.
 
     Args:
         f: Función del endpoint a proteger.
@@ -39,12 +84,15 @@ def requiere_api_key(f):
         function: Decorador que valida la API key antes de ejecutar el endpoint.
 
     Raises:
-        HTTP 401: Si no se proporciona token o el formato es inválido.
+        HTTP 401: Si no se proporciona token.
         HTTP 403: Si el token proporcionado no coincide con la API key configurada.
     """
     @wraps(f)
     def decorador(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
+        auth_header = request.headers.get('Authorization', '')
+        
+        if _BEARER_API_KEY is not None and hmac.compare_digest(auth_header.encode('utf-8'), _BEARER_API_KEY):
+            return f(*args, **kwargs)
         
         if not auth_header:
             return jsonify({
@@ -52,15 +100,9 @@ def requiere_api_key(f):
                 'mensaje': 'Se requiere header Authorization con Bearer token'
             }), 401
         
-        try:
-            token = auth_header.split(' ')[1] if auth_header.startswith('Bearer ') else auth_header
-        except IndexError:
-            return jsonify({
-                'error': 'Formato de token inválido',
-                'mensaje': 'Formato esperado: Bearer <token>'
-            }), 401
+        token = auth_header[len('Bearer '):] if auth_header.startswith('Bearer ') else auth_header
         
-        if token != API_KEY:
+        if _API_KEY_BYTES is None or not hmac.compare_digest(token.encode('utf-8'), _API_KEY_BYTES):
             return jsonify({
                 'error': 'Token inválido',
                 'mensaje': 'La API key proporcionada no es válida'
@@ -71,6 +113,120 @@ def requiere_api_key(f):
     return decorador
 
 
+def _consultar_producto(codigo_barras):
+    """Consulta un producto en PostgreSQL y arma el cuerpo de la respuesta.
+
+    El JSON llega ya serializado desde PostgreSQL, por lo que sólo se codifica
+    a bytes y se calcula su ETag.
+
+    Args:
+        codigo_barras (str): Código de barras del producto a buscar.
+
+    Returns:
+        tuple: (cuerpo, etag) con el JSON serializado en bytes y su hash MD5,
+            o None si el producto no existe.
+    """
+    if loteador is not None:
+        respuesta = loteador.buscar(codigo_barras)
+    else:
+        respuesta = buscador.buscar_por_codigo_barras(codigo_barras)
+    
+    if respuesta is None:
+        return None
+    
+    cuerpo = respuesta.encode('utf-8')
+    return cuerpo, hashlib.md5(cuerpo).hexdigest()
+
+
+# Cache por proceso con TTL: /admin/flush sólo llega al worker que atiende la
+# solicitud, así que los demás dejan de servir datos viejos (incluidos los 404
+# cacheados durante una importación) a lo sumo CACHE_TTL segundos después.
+_cache_memoria = TTLCache(maxsize=10000, ttl=CACHE_TTL)
+_cache_memoria_lock = threading.Lock()
+
+
+def _consultar_producto_en_memoria(codigo_barras):
+    """Resuelve la búsqueda desde la cache en memoria del proceso.
+
+    Args:
+        codigo_barras (str): Código de barras del producto a buscar.
+
+    Returns:
+        tuple: (cuerpo, etag) o None si el producto no existe.
+    """
+    with _cache_memoria_lock:
+        try:
+            return _cache_memoria[codigo_barras]
+        except KeyError:
+            pass
+    
+    respuesta = _consultar_producto(codigo_barras)
+    with _cache_memoria_lock:
+        _cache_memoria[codigo_barras] = respuesta
+    return respuesta
+
+
+def _consultar_producto_en_redis(codigo_barras):
+    """Resuelve la búsqueda desde Redis, consultando PostgreSQL sólo ante un miss.
+
+    El cuerpo y su ETag se guardan como bytes bajo claves separadas con TTL
+    CACHE_TTL, por lo que un hit no requiere deserializar nada. Los productos
+    inexistentes se guardan con cuerpo vacío. Si Redis no está disponible, la
+    búsqueda se resuelve directamente contra PostgreSQL.
+
+    Args:
+        codigo_barras (str): Código de barras del producto a buscar.
+
+    Returns:
+        tuple: (cuerpo, etag) o None si el producto no existe.
+    """
+    clave_cuerpo = f'{_PREFIJO_REDIS}prod:{codigo_barras}'
+    clave_etag = f'{_PREFIJO_REDIS}etag:{codigo_barras}'
+    
+    try:
+        cuerpo, etag = redis_cliente.mget(clave_cuerpo, clave_etag)
+        if cuerpo is not None and etag is not None:
+            return (cuerpo, etag.decode('ascii')) if cuerpo else None
+    except redis.RedisError:
+        return _consultar_producto(codigo_barras)
+    
+    respuesta = _consultar_producto(codigo_barras)
+    cuerpo, etag = respuesta if respuesta is not None else (b'', '')
+    
+    try:
+        pipe = redis_cliente.pipeline(transaction=False)
+        pipe.setex(clave_cuerpo, CACHE_TTL, cuerpo)
+        pipe.setex(clave_etag, CACHE_TTL, etag)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+    
+    return respuesta
+
+
+def _lookup(codigo_barras):
+    """Obtiene la respuesta de un producto desde la cache correspondiente.
+
+    Los datos del SEPA sólo cambian cuando corre la importación, por lo que las
+    búsquedas repetidas se resuelven sin consultar PostgreSQL. Se cachea el
+    cuerpo JSON ya serializado junto con su ETag: en Redis si REDIS_URL está
+    configurada (compartida entre todos los workers de gunicorn) o, si no, en
+    una cache en memoria de cada proceso; en ambos casos las entradas vencen a
+    los CACHE_TTL segundos. La cache se invalida mediante el endpoint
+    /admin/flush.
+
+    Args:
+        codigo_barras (str): Código de barras del producto a buscar.
+
+    Returns:
+        tuple: (cuerpo, etag) con el JSON serializado en bytes y su hash MD5,
+            o None si el producto no existe.
+    """
+    if redis_cliente is not None:
+        return _consultar_producto_en_redis(codigo_barras)
+    return _consultar_producto_en_memoria(codigo_barras)
+
+
 @api_v1.route('/producto/<codigo_barras>', methods=['GET'])
 @requiere_api_key
 def buscar_producto(codigo_barras):
@@ -82,7 +238,9 @@ def buscar_producto(codigo_barras):
     Returns:
         tuple: Tupla con (JSON response, status_code).
             - 200: Producto encontrado exitosamente.
-            - 404: Producto no encontrado en la base de datos.
+            - 304: El cliente ya tiene la versión actual (If-None-Match).
+            - 404: Producto no encontrado en la base de datos, o código de
+              barras con formato inválido (se rechaza sin consultar la base).
             - 500: Error interno del servidor.
 
     Example:
@@ -102,39 +260,28 @@ def buscar_producto(codigo_barras):
         }
     """
     try:
-        resultados = buscador.buscar_por_codigo_barras(codigo_barras)
+        if not _PATRON_CODIGO_BARRAS.fullmatch(codigo_barras):
+            respuesta = None
+        else:
+            respuesta = _lookup(codigo_barras)
         
-        if not resultados:
-            return jsonify({
-                'error': 'Producto no encontrado',
-                'id_producto': codigo_barras
-            }), 404
-        
-        primer_resultado = resultados[0]
-        comercios = []
+        if respuesta is None:
+            return Response(
+                _PLANTILLA_NO_ENCONTRADO % orjson.dumps(codigo_barras),
+                status=404,
+                mimetype='application/json'
+            )
         
-        for resultado in resultados:
-            nombre_comercio = resultado['comercio_nombre']
-            
-            if resultado['id_comercio'] == 10:
-                if nombre_comercio in ("Express", "Market"):
-                    nombre_comercio = f"Carrefour {nombre_comercio}"
-            
-            comercios.append({
-                'id_comercio': str(resultado['id_comercio']),
-                'id_bandera': str(resultado['id_bandera']),
-                'nombre_comercio': nombre_comercio,
-                'precio_producto': f"${resultado['precio_lista']:.0f}"
-            })
+        cuerpo, etag = respuesta
         
-        respuesta = {
-            'id_producto': primer_resultado['codigo_barras'],
-            'nombre_producto': primer_resultado['descripcion'],
-            'marca_producto': primer_resultado['marca'] or '',
-            'comercios': comercios
-        }
+        if request.if_none_match.contains(etag):
+            respuesta_http = Response(status=304)
+        else:
+            respuesta_http = Response(cuerpo, mimetype='application/json')
         
-        return jsonify(respuesta), 200
+        respuesta_http.set_etag(etag)
+        respuesta_http.headers['Cache-Control'] = 'public, max-age=300'
+        return respuesta_http
         
     except Exception as e:
         return jsonify({
@@ -148,10 +295,40 @@ def health_check():
     """Endpoint de verificación de salud del servicio.
 
     Returns:
-        tuple: Tupla con (JSON response, status_code 200).
+        Response: JSON pre-serializado con status_code 200.
+            {"status": "ok"}
+    """
+    return Response(_CUERPO_OK, mimetype='application/json')
+
+
+@api_v1.route('/admin/flush', methods=['POST'])
+@requiere_api_key
+def vaciar_cache():
+    """Vacía la cache de productos (en memoria y en Redis, si está configurado).
+
+    Debe invocarse luego de cada importación para que las búsquedas reflejen
+    los datos nuevos.
+
+    Returns:
+        Response: JSON pre-serializado con status_code 200.
             {"status": "ok"}
+        tuple: (JSON, 503) si no se pudo vaciar la cache de Redis.
     """
-    return jsonify({'status': 'ok'}), 200
+    with _cache_memoria_lock:
+        _cache_memoria.clear()
+    
+    if redis_cliente is not None:
+        try:
+            claves = list(redis_cliente.scan_iter(match=f'{_PREFIJO_REDIS}*', count=1000))
+            for i in range(0, len(claves), 1000):
+                redis_cliente.delete(*claves[i:i + 1000])
+        except redis.RedisError as e:
+            return jsonify({
+                'error': 'No se pudo vaciar la cache de Redis',
+                'mensaje': str(e)
+            }), 503
+    
+    return Response(_CUERPO_OK, mimetype='application/json')
 
 
 # Registrar el Blueprint en la aplicación
@@ -159,6 +336,8 @@ app.register_blueprint(api_v1)
 
 
 if __name__ == '__main__':
+    # Servidor de desarrollo de Flask (python -m app.api desde la raíz del
+    # proyecto). En producción la API se sirve con gunicorn (ver gunicorn.conf.py).
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '0.0.0.0')
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
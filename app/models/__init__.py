@@ -2,6 +2,7 @@
 Modelos de datos y lógica de negocio
 """
 from .buscador import BuscadorProductos
+from .loteador import LoteadorBusquedas
 
-__all__ = ['BuscadorProductos']
+__all__ = ['BuscadorProductos', 'LoteadorBusquedas']
 
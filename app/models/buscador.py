@@ -5,9 +5,92 @@ Este módulo proporciona la clase BuscadorProductos para realizar consultas
 optimizadas sobre la base de datos PostgreSQL que contiene información de
 productos y comercios del SEPA.
 """
-import psycopg2
-from typing import List, Dict
-from config import DB_CONFIG
+import threading
+from contextlib import contextmanager
+from psycopg2 import errors, extensions
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from typing import List, Dict, Optional
+from config import DB_CONFIG, DB_POOL_MIN, DB_POOL_MAX
+
+
+# Convierte NUMERIC a float directamente en el typecaster de psycopg2, en
+# lugar de crear un Decimal por valor y convertirlo después en Python.
+_DEC2FLOAT = extensions.new_type(
+    extensions.DECIMAL.values,
+    'DEC2FLOAT',
+    lambda valor, cursor: float(valor) if valor is not None else None
+)
+extensions.register_type(_DEC2FLOAT)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_CONSULTA_PRODUCTOS = '''
+    SELECT
+        p.id_producto,
+        json_build_object(
+            'id_producto', p.id_producto,
+            'nombre_producto', (array_agg(p.productos_descripcion ORDER BY p.id_comercio, p.id_bandera))[1],
+            'marca_producto', COALESCE((array_agg(p.productos_marca ORDER BY p.id_comercio, p.id_bandera))[1], ''),
+            'comercios', json_agg(json_build_object(
+                'id_comercio', p.id_comercio::text,
+                'id_bandera', p.id_bandera::text,
+                'nombre_comercio', CASE
+                    WHEN p.id_comercio = 10 AND c.comercio_bandera_nombre IN ('Express', 'Market')
+                        THEN 'Carrefour ' || c.comercio_bandera_nombre
+                    ELSE COALESCE(NULLIF(c.comercio_bandera_nombre, ''), c.comercio_razon_social)
+                END,
+                'precio_producto', '$' || round(p.productos_precio_lista::float8)::bigint
+            ) ORDER BY p.id_comercio, p.id_bandera)
+        )::text AS producto
+    FROM (
+        SELECT DISTINCT ON (id_producto, id_comercio, id_bandera)
+            id_producto,
+            id_comercio,
+            id_bandera,
+            productos_precio_lista,
+            productos_descripcion,
+            productos_marca
+        FROM productos
+        WHERE {filtro}
+        ORDER BY id_producto, id_comercio, id_bandera, productos_precio_lista ASC
+    ) p
+    INNER JOIN comercios c ON p.id_comercio = c.id_comercio 
+                           AND p.id_bandera = c.id_bandera
+    GROUP BY p.id_producto
+'''
+
+_PREPARE_BUSCAR_POR_CODIGO = (
+    'PREPARE buscar_por_codigo (text) AS'
+    + _CONSULTA_PRODUCTOS.format(filtro='id_producto = $1')
+)
+
+_PREPARE_BUSCAR_POR_CODIGOS = (
+    'PREPARE buscar_por_codigos (text[]) AS'
+    + _CONSULTA_PRODUCTOS.format(filtro='id_producto = ANY($1)')
+)
+
+
+def _obtener_pool():
+    """Obtiene el pool de conexiones compartido, creándolo al primer uso.
+
+    El pool se crea de forma lazy para que cada worker de gunicorn abra sus
+    propias conexiones después del fork, en lugar de heredar sockets abiertos
+    durante la importación del módulo.
+
+    Returns:
+        ThreadedConnectionPool: Pool de conexiones a PostgreSQL.
+
+    Raises:
+        psycopg2.Error: Si no se pueden establecer las conexiones iniciales.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
+    return _pool
 
 
 class BuscadorProductos:
@@ -18,91 +101,113 @@ class BuscadorProductos:
     en diferentes comercios.
     """
     
-    def __init__(self):
-        """Inicializa el buscador con conexión a PostgreSQL.
+    @contextmanager
+    def _conn(self):
+        """Toma una conexión del pool y la devuelve al finalizar el bloque.
         
-        La conexión se establece de forma lazy (al primer uso) para optimizar
-        recursos y permitir reutilización de conexiones.
-        """
-        self.conn = None
-    
-    def _get_connection(self):
-        """Obtiene o crea una conexión a PostgreSQL.
+        Cada solicitud usa su propia conexión, de modo que las consultas de
+        distintos threads se ejecutan en paralelo. Las conexiones trabajan en
+        modo autocommit porque todas las consultas son de solo lectura.
         
-        Returns:
+        Yields:
             psycopg2.connection: Conexión activa a la base de datos.
             
         Raises:
             psycopg2.Error: Si no se puede establecer la conexión.
         """
-        if self.conn is None or self.conn.closed:
-            self.conn = psycopg2.connect(**DB_CONFIG)
-        return self.conn
+        pool = _obtener_pool()
+        conn = pool.getconn()
+        try:
+            conn.autocommit = True
+            yield conn
+        finally:
+            pool.putconn(conn)
     
-    def buscar_por_codigo_barras(self, codigo_barras: str) -> List[Dict]:
+    def _ejecutar_preparada(self, cursor, nombre, prepare, parametro):
+        """Ejecuta una consulta preparada, preparándola si la conexión no la tiene.
+        
+        Args:
+            cursor (psycopg2.cursor): Cursor de una conexión del pool.
+            nombre (str): Nombre de la sentencia preparada.
+            prepare (str): Sentencia PREPARE que la define.
+            parametro: Único parámetro de la consulta.
+        """
+        try:
+            cursor.execute(f'EXECUTE {nombre} (%s)', (parametro,))
+        except errors.InvalidSqlStatementName:
+            cursor.execute(prepare)
+            cursor.execute(f'EXECUTE {nombre} (%s)', (parametro,))
+    
+    def buscar_por_codigo_barras(self, codigo_barras: str) -> Optional[str]:
         """Busca un producto por código de barras en todos los comercios disponibles.
 
-        Realiza una búsqueda optimizada usando JOIN y DISTINCT ON para eliminar
+        Realiza una búsqueda optimizada usando DISTINCT ON para eliminar
         duplicados por comercio/bandera, retornando el precio más bajo cuando
         hay múltiples precios para el mismo producto en el mismo comercio.
+        PostgreSQL agrega los comercios con json_agg y devuelve una única fila
+        con la respuesta ya armada y serializada como texto, de modo que se
+        puede enviar tal cual sin parsearla en Python.
+
+        La consulta se prepara con PREPARE la primera vez que se usa en cada
+        conexión del pool, evitando el parseo y planificación en cada llamada.
+        El subquery sobre productos se resuelve con un Index Only Scan sobre
+        idx_productos_ean_cov (ver crear_indices_productos en el importador);
+        cualquier columna nueva de productos que se agregue a esta consulta
+        debe sumarse también al INCLUDE de ese índice.
 
         Args:
             codigo_barras (str): Código de barras del producto (id_producto).
 
         Returns:
-            List[Dict]: Lista de diccionarios con información del producto en cada comercio.
-                Cada diccionario contiene:
-                - codigo_barras (str): Código de barras del producto.
-                - descripcion (str): Descripción del producto.
-                - marca (str): Marca del producto (puede ser None).
-                - precio_lista (float): Precio del producto en el comercio.
-                - id_comercio (int): ID del comercio.
-                - id_bandera (int): ID de la bandera del comercio.
-                - comercio_nombre (str): Nombre del comercio.
-                - comercio_url (str): URL del comercio (puede ser None).
+            Optional[str]: JSON del producto encontrado o None si no existe.
+                El objeto contiene:
+                - id_producto (str): Código de barras del producto.
+                - nombre_producto (str): Descripción del producto.
+                - marca_producto (str): Marca del producto (vacía si no tiene).
+                - comercios (list): Un diccionario por comercio/bandera con
+                  id_comercio, id_bandera, nombre_comercio y precio_producto
+                  (precio redondeado con formato "$1200"). Las banderas
+                  Express y Market de Carrefour (id_comercio 10) se informan
+                  como "Carrefour Express" y "Carrefour Market".
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT DISTINCT ON (p.id_comercio, p.id_bandera)
-                p.id_producto,
-                p.productos_descripcion,
-                p.productos_marca,
-                p.productos_precio_lista,
-                p.id_comercio,
-                p.id_bandera,
-                c.comercio_bandera_nombre,
-                c.comercio_razon_social,
-                c.comercio_bandera_url
-            FROM productos p
-            INNER JOIN comercios c ON p.id_comercio = c.id_comercio 
-                                   AND p.id_bandera = c.id_bandera
-            WHERE p.id_producto = %s
-            ORDER BY p.id_comercio, p.id_bandera, p.productos_precio_lista ASC
-        ''', (codigo_barras,))
-        
-        resultados = []
-        for fila in cursor.fetchall():
-            resultados.append({
-                'codigo_barras': fila[0],
-                'descripcion': fila[1],
-                'marca': fila[2],
-                'precio_lista': float(fila[3]),
-                'id_comercio': fila[4],
-                'id_bandera': fila[5],
-                'comercio_nombre': fila[6] or fila[7],
-                'comercio_url': fila[8]
-            })
-        
-        return resultados
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            
+            self._ejecutar_preparada(cursor, 'buscar_por_codigo', _PREPARE_BUSCAR_POR_CODIGO, codigo_barras)
+            
+            fila = cursor.fetchone()
+            return fila[1] if fila else None
+    
+    def buscar_por_codigos_barras(self, codigos_barras: List[str]) -> Dict[str, str]:
+        """Busca varios productos por código de barras en una sola consulta.
+
+        Usa la misma consulta que buscar_por_codigo_barras filtrando con
+        id_producto = ANY(...), de modo que un lote de búsquedas se resuelve
+        en un único viaje a la base de datos.
+
+        Args:
+            codigos_barras (List[str]): Códigos de barras a buscar.
+
+        Returns:
+            Dict[str, str]: JSON de los productos encontrados indexados por
+                código de barras, con el mismo formato que buscar_por_codigo_barras. Los códigos
+                inexistentes no aparecen en el resultado.
+        """
+        with self._conn() as conn:
+            cursor = conn.cursor()
+            
+            self._ejecutar_preparada(cursor, 'buscar_por_codigos', _PREPARE_BUSCAR_POR_CODIGOS, list(codigos_barras))
+            
+            return dict(cursor.fetchall())
     
     def buscar_por_descripcion(self, termino: str, limite: int = 20) -> List[Dict]:
         """Busca productos por descripción usando búsqueda parcial (LIKE).
 
         Realiza una búsqueda por coincidencia parcial en la descripción del producto,
         agrupando resultados por producto y retornando estadísticas de precios
-        (mínimo, máximo) y cantidad de comercios donde está disponible.
+        (mínimo, máximo) y cantidad de comercios donde está disponible. El LIKE
+        con comodín inicial se resuelve con el índice de trigramas
+        idx_prod_desc_trgm creado por el importador.
 
         Args:
             termino (str): Término de búsqueda para buscar en la descripción.
@@ -119,33 +224,22 @@ class BuscadorProductos:
                 - precio_maximo (float): Precio más alto encontrado.
                 - cantidad_comercios (int): Cantidad de comercios donde está disponible.
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT DISTINCT
-                id_producto,
-                productos_descripcion,
-                productos_marca,
-                MIN(productos_precio_lista) as precio_minimo,
-                MAX(productos_precio_lista) as precio_maximo,
-                COUNT(*) as cantidad_comercios
-            FROM productos
-            WHERE productos_descripcion LIKE %s
-            GROUP BY id_producto, productos_descripcion, productos_marca
-            ORDER BY cantidad_comercios DESC
-            LIMIT %s
-        ''', (f'%{termino}%', limite))
-        
-        resultados = []
-        for fila in cursor.fetchall():
-            resultados.append({
-                'codigo_barras': fila[0],
-                'descripcion': fila[1],
-                'marca': fila[2],
-                'precio_minimo': float(fila[3]) if fila[3] else None,
-                'precio_maximo': float(fila[4]) if fila[4] else None,
-                'cantidad_comercios': fila[5]
-            })
-        
-        return resultados
+        with self._conn() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            
+            cursor.execute('''
+                SELECT
+                    id_producto AS codigo_barras,
+                    productos_descripcion AS descripcion,
+                    productos_marca AS marca,
+                    MIN(productos_precio_lista) as precio_minimo,
+                    MAX(productos_precio_lista) as precio_maximo,
+                    COUNT(*) as cantidad_comercios
+                FROM productos
+                WHERE productos_descripcion LIKE %s
+                GROUP BY id_producto, productos_descripcion, productos_marca
+                ORDER BY cantidad_comercios DESC, id_producto, productos_descripcion, productos_marca
+                LIMIT %s
+            ''', (f'%{termino}%', limite))
+            
+            return cursor.fetchall()
@@ -0,0 +1,96 @@
+"""
+Agrupación de búsquedas concurrentes por código de barras.
+
+Este módulo proporciona la clase LoteadorBusquedas, que junta las búsquedas
+que llegan en una ventana corta de tiempo y las resuelve con una sola
+consulta a PostgreSQL, amortizando la latencia de ida y vuelta entre todos
+los threads que esperan.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+
+class _Lote:
+    """Búsquedas pendientes de un mismo lote, indexadas por código de barras."""
+    
+    def __init__(self):
+        self.futuros = {}
+        self.lleno = threading.Event()
+
+
+class LoteadorBusquedas:
+    """Agrupa búsquedas por código de barras en lotes de una sola consulta.
+    
+    El primer thread que llega a un lote vacío actúa como líder: espera hasta
+    que se cumpla la ventana de tiempo o el lote alcance su tamaño máximo,
+    ejecuta la consulta y entrega el resultado a cada thread en espera. No se
+    usan threads propios, por lo que es seguro con workers de gunicorn.
+    """
+    
+    def __init__(self, buscador, ventana_ms: int = 50, max_lote: int = 32):
+        """Inicializa el loteador.
+        
+        Args:
+            buscador (BuscadorProductos): Buscador usado para ejecutar los lotes.
+            ventana_ms (int, optional): Tiempo máximo de espera para juntar
+                búsquedas, en milisegundos. Defaults to 50.
+            max_lote (int, optional): Cantidad de códigos distintos que cierra
+                un lote antes de la ventana. Defaults to 32.
+        """
+        self._buscador = buscador
+        self._ventana = ventana_ms / 1000
+        self._max_lote = max_lote
+        self._lock = threading.Lock()
+        self._lote = None
+    
+    def buscar(self, codigo_barras: str) -> Optional[str]:
+        """Busca un producto agrupando la consulta con otras concurrentes.
+        
+        Args:
+            codigo_barras (str): Código de barras del producto.
+        
+        Returns:
+            Optional[str]: JSON del producto con el formato de
+                BuscadorProductos.buscar_por_codigo_barras, o None si no existe.
+        
+        Raises:
+            psycopg2.Error: Si falla la consulta del lote.
+        """
+        with self._lock:
+            lote = self._lote
+            es_lider = lote is None
+            if es_lider:
+                lote = self._lote = _Lote()
+            
+            futuro = lote.futuros.get(codigo_barras)
+            if futuro is None:
+                futuro = lote.futuros[codigo_barras] = Future()
+                if len(lote.futuros) >= self._max_lote:
+                    self._lote = None
+                    lote.lleno.set()
+        
+        if es_lider:
+            lote.lleno.wait(self._ventana)
+            with self._lock:
+                if self._lote is lote:
+                    self._lote = None
+            self._ejecutar(lote)
+        
+        return futuro.result()
+    
+    def _ejecutar(self, lote: _Lote):
+        """Ejecuta la consulta de un lote cerrado y resuelve sus futuros.
+        
+        Args:
+            lote (_Lote): Lote que ya no acepta nuevas búsquedas.
+        """
+        try:
+            productos = self._buscador.buscar_por_codigos_barras(list(lote.futuros))
+        except Exception as e:
+            for futuro in lote.futuros.values():
+                futuro.set_exception(e)
+            return
+        
+        for codigo_barras, futuro in lote.futuros.items():
+            futuro.set_result(productos.get(codigo_barras))
@@ -8,18 +8,37 @@ de carga masiva (COPY).
 """
 import psycopg2
 from psycopg2 import sql
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import csv
+import io
 import os
 import zipfile
 import tempfile
-import re
 import shutil
-from config import DB_CONFIG, COMERCIOS_PERMITIDOS
+import struct
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from config import (DB_CONFIG, COMERCIOS_PERMITIDOS, IMPORT_WORK_MEM,
+                    IMPORT_MAINTENANCE_WORK_MEM, IMPORT_PARALLEL_WORKERS, SEPA_TMPDIR)
 
 
 def conectar_postgresql():
     """Establece conexión con la base de datos PostgreSQL.
 
+    La sesión se configura para carga masiva mediante el parámetro options de
+    libpq (sin consultas extra ni riesgo de perder los SET en un rollback):
+    - synchronous_commit = off: la importación se puede repetir completa si
+      falla, así que no hace falta esperar el flush del WAL en cada commit.
+    - work_mem y maintenance_work_mem (IMPORT_WORK_MEM e
+      IMPORT_MAINTENANCE_WORK_MEM): la deduplicación de staging y los CREATE
+      INDEX se resuelven en memoria.
+    - max_parallel_maintenance_workers y max_parallel_workers_per_gather
+      (IMPORT_PARALLEL_WORKERS).
+
     Returns:
         psycopg2.connection: Conexión activa a PostgreSQL.
 
@@ -27,7 +46,14 @@ def conectar_postgresql():
         psycopg2.Error: Si no se puede establecer la conexión.
     """
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        opciones = ' '.join([
+            '-c synchronous_commit=off',
+            f'-c work_mem={IMPORT_WORK_MEM}',
+            f'-c maintenance_work_mem={IMPORT_MAINTENANCE_WORK_MEM}',
+            f'-c max_parallel_maintenance_workers={IMPORT_PARALLEL_WORKERS}',
+            f'-c max_parallel_workers_per_gather={IMPORT_PARALLEL_WORKERS}'
+        ])
+        conn = psycopg2.connect(**DB_CONFIG, options=opciones)
         print(f"[DEBUG] Conexion a PostgreSQL establecida: {DB_CONFIG['database']}")
         return conn
     except psycopg2.Error as e:
@@ -38,10 +64,15 @@ def conectar_postgresql():
 def crear_tablas(conn):
     """Crea las tablas necesarias en PostgreSQL si no existen.
 
-    Crea tres tablas:
+    Crea cuatro tablas:
     - comercios: Información de comercios con clave primaria compuesta.
-    - productos: Productos con foreign key a comercios.
+    - productos: Productos. La foreign key a comercios no se declara acá:
+      la agrega agregar_foreign_key_productos una vez terminada la carga.
     - productos_staging: Tabla temporal para carga masiva sin restricciones.
+      Es UNLOGGED y sin autovacuum: se vacía al final de cada importación, así
+      que no tiene sentido escribir su contenido al WAL.
+    - comercios_staging: Tabla UNLOGGED donde se cargan con COPY los comercios
+      de cada ZIP antes de pasarlos a comercios.
 
     Args:
         conn (psycopg2.connection): Conexión a PostgreSQL.
@@ -70,21 +101,38 @@ def crear_tablas(conn):
             id_producto TEXT,
             productos_precio_lista NUMERIC(10,2),
             productos_descripcion TEXT,
-            productos_marca TEXT,
-            FOREIGN KEY (id_comercio, id_bandera) REFERENCES comercios(id_comercio, id_bandera)
+            productos_marca TEXT
         )
     ''')
     
+    # Bases creadas con versiones anteriores tienen la foreign key declarada
+    # en la tabla; se quita para que la carga masiva no la pague.
+    cursor.execute('''
+        ALTER TABLE productos DROP CONSTRAINT IF EXISTS productos_id_comercio_id_bandera_fkey;
+        ALTER TABLE productos DROP CONSTRAINT IF EXISTS fk_productos_comercios
+    ''')
+    
     cursor.execute('''
         DROP TABLE IF EXISTS productos_staging CASCADE;
-        CREATE TABLE productos_staging (
+        CREATE UNLOGGED TABLE productos_staging (
             id_comercio INTEGER,
             id_bandera INTEGER,
             id_producto TEXT,
             productos_precio_lista NUMERIC(10,2),
             productos_descripcion TEXT,
             productos_marca TEXT
-        )
+        ) WITH (autovacuum_enabled = false, toast.autovacuum_enabled = false)
+    ''')
+    
+    cursor.execute('''
+        DROP TABLE IF EXISTS comercios_staging;
+        CREATE UNLOGGED TABLE comercios_staging (
+            id_comercio INTEGER,
+            id_bandera INTEGER,
+            comercio_razon_social TEXT,
+            comercio_bandera_nombre TEXT,
+            comercio_bandera_url TEXT
+        ) WITH (autovacuum_enabled = false)
     ''')
     
     conn.commit()
@@ -95,8 +143,16 @@ def crear_tablas(conn):
 def mover_datos_staging_a_final(conn):
     """Transfiere datos de la tabla staging a la tabla final eliminando duplicados.
 
-    Utiliza DISTINCT ON para eliminar duplicados por (id_comercio, id_bandera, id_producto),
-    manteniendo el registro con el precio más bajo cuando hay múltiples precios.
+    Elimina duplicados por (id_comercio, id_bandera, id_producto), manteniendo
+    el registro con el precio más bajo cuando hay múltiples precios. En lugar
+    de ordenar toda la tabla staging (DISTINCT ON ... ORDER BY), calcula el
+    precio mínimo de cada producto con un GROUP BY (HashAggregate) y toma la
+    descripción y marca de una de las filas con ese precio. Con el work_mem
+    de la sesión (IMPORT_WORK_MEM) la agregación se resuelve en memoria.
+
+    Antes del INSERT elimina la primary key y los índices de productos (el
+    TRUNCATE de la fase 1 los conserva), para no mantener los B-trees fila
+    por fila; crear_indices_productos los reconstruye al final de una vez.
 
     Args:
         conn (psycopg2.connection): Conexión a PostgreSQL.
@@ -107,21 +163,31 @@ def mover_datos_staging_a_final(conn):
     print("[DEBUG] Moviendo datos de staging a tabla final...")
     cursor = conn.cursor()
     
-    cursor.execute('SET session_replication_role = replica')
+    cursor.execute('ALTER TABLE productos DROP CONSTRAINT IF EXISTS productos_pkey')
+    cursor.execute('DROP INDEX IF EXISTS idx_productos_ean_cov, idx_comercio_bandera, idx_prod_desc_trgm, '
+                   'idx_codigo_barras')
     
+    # array_agg(...)[1] sobre descripción y marca toma ambos valores de la
+    # misma fila, ya que los dos agregados recorren el grupo en el mismo orden.
     cursor.execute('''
         INSERT INTO productos (id_comercio, id_bandera, id_producto, productos_precio_lista,
                               productos_descripcion, productos_marca)
-        SELECT DISTINCT ON (id_comercio, id_bandera, id_producto)
-            id_comercio, id_bandera, id_producto, productos_precio_lista,
-            productos_descripcion, productos_marca
-        FROM productos_staging
-        ORDER BY id_comercio, id_bandera, id_producto, productos_precio_lista
+        WITH minimos AS (
+            SELECT id_comercio, id_bandera, id_producto,
+                   MIN(productos_precio_lista) AS productos_precio_lista
+            FROM productos_staging
+            GROUP BY id_comercio, id_bandera, id_producto
+        )
+        SELECT s.id_comercio, s.id_bandera, s.id_producto, s.productos_precio_lista,
+               (array_agg(s.productos_descripcion))[1],
+               (array_agg(s.productos_marca))[1]
+        FROM productos_staging s
+        JOIN minimos m USING (id_comercio, id_bandera, id_producto, productos_precio_lista)
+        GROUP BY s.id_comercio, s.id_bandera, s.id_producto, s.productos_precio_lista
     ''')
     
     filas_insertadas = cursor.rowcount
     
-    cursor.execute('SET session_replication_role = DEFAULT')
     cursor.execute('TRUNCATE TABLE productos_staging')
     
     conn.commit()
@@ -129,107 +195,472 @@ def mover_datos_staging_a_final(conn):
     return filas_insertadas
 
 
+def _crear_indice(nombre, sentencia, simultaneos):
+    """Crea un índice de productos en una conexión propia.
+
+    maintenance_work_mem y max_parallel_maintenance_workers de la conexión
+    (IMPORT_MAINTENANCE_WORK_MEM e IMPORT_PARALLEL_WORKERS) se dividen entre
+    las construcciones simultáneas, para que juntas no excedan ese total.
+
+    Args:
+        nombre (str): Nombre del índice, usado en los mensajes.
+        sentencia (str): CREATE INDEX a ejecutar.
+        simultaneos (int): Cantidad de índices que se construyen a la vez.
+
+    Raises:
+        psycopg2.Error: Si falla la creación del índice.
+    """
+    conn = conectar_postgresql()
+    conn.autocommit = True
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT set_config('maintenance_work_mem',
+                              GREATEST(1024, pg_size_bytes(current_setting('maintenance_work_mem')) / 1024 / %(n)s) || 'kB',
+                              false),
+                   set_config('max_parallel_maintenance_workers',
+                              (current_setting('max_parallel_maintenance_workers')::int / %(n)s)::text,
+                              false)
+        ''', {'n': simultaneos})
+        print(f"[DEBUG] Creando indice {nombre}...")
+        cursor.execute(sentencia)
+        print(f"[DEBUG] Indice {nombre} creado")
+    finally:
+        conn.close()
+
+
 def crear_indices_productos(conn):
     """Crea índices en la tabla productos para optimizar búsquedas.
 
-    Crea dos índices:
-    - idx_codigo_barras: En id_producto para búsquedas por código de barras.
+    Crea la primary key y tres índices, los B-tree con fillfactor 100 porque
+    la tabla no se modifica hasta la próxima importación:
+    - productos_pkey: Primary key en id, eliminada durante la carga.
+    - idx_productos_ean_cov: Índice de cobertura en (id_producto, id_comercio,
+      id_bandera, productos_precio_lista) que incluye descripción y marca, de
+      modo que la búsqueda por código de barras se resuelva con un Index Only
+      Scan sin leer el heap. Reemplaza al antiguo idx_codigo_barras.
     - idx_comercio_bandera: En (id_comercio, id_bandera) para optimizar JOINs.
+    - idx_prod_desc_trgm: Índice GIN de trigramas (pg_trgm) en
+      productos_descripcion, que permite resolver los LIKE '%termino%' de
+      buscar_por_descripcion sin recorrer toda la tabla. Si la extensión no
+      está disponible se omite con una advertencia.
+
+    La primary key se crea primero en la conexión recibida, porque ALTER TABLE
+    bloquea la tabla por completo. Los otros tres índices se construyen en
+    paralelo, cada uno en su propia conexión: CREATE INDEX toma un lock SHARE,
+    que no entra en conflicto con otros CREATE INDEX sobre la misma tabla. La
+    memoria y los workers de mantenimiento se reparten entre ellos.
+
+    Al finalizar ejecuta VACUUM ANALYZE para actualizar el visibility map y
+    las estadísticas, requisito para que el planner elija el Index Only Scan.
 
     Args:
         conn (psycopg2.connection): Conexión a PostgreSQL.
+
+    Raises:
+        psycopg2.Error: Si falla la creación de la primary key o de un índice
+            B-tree.
     """
     print("[DEBUG] Creando indices en tabla productos...")
     cursor = conn.cursor()
     
-    print("[DEBUG] Creando indice idx_codigo_barras...")
+    print("[DEBUG] Creando primary key productos_pkey...")
     cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_codigo_barras ON productos(id_producto)
+        ALTER TABLE productos ADD CONSTRAINT productos_pkey PRIMARY KEY (id) WITH (fillfactor = 100)
     ''')
+    conn.commit()
+    
+    trigramas_disponibles = True
+    try:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        trigramas_disponibles = False
+        print(f"[ADVERTENCIA] No se pudo crear el indice de trigramas: {e}")
+    
+    indices = {
+        'idx_productos_ean_cov': '''
+            CREATE INDEX IF NOT EXISTS idx_productos_ean_cov
+            ON productos (id_producto, id_comercio, id_bandera, productos_precio_lista)
+            INCLUDE (productos_descripcion, productos_marca)
+            WITH (fillfactor = 100)
+        ''',
+        'idx_comercio_bandera': '''
+            CREATE INDEX IF NOT EXISTS idx_comercio_bandera ON productos(id_comercio, id_bandera)
+            WITH (fillfactor = 100)
+        '''
+    }
+    if trigramas_disponibles:
+        indices['idx_prod_desc_trgm'] = '''
+            CREATE INDEX IF NOT EXISTS idx_prod_desc_trgm
+            ON productos USING gin (productos_descripcion gin_trgm_ops)
+        '''
+    
+    with ThreadPoolExecutor(max_workers=len(indices)) as executor:
+        futuros = {
+            executor.submit(_crear_indice, nombre, sentencia, len(indices)): nombre
+            for nombre, sentencia in indices.items()
+        }
+        for futuro in as_completed(futuros):
+            try:
+                futuro.result()
+            except psycopg2.Error as e:
+                if futuros[futuro] != 'idx_prod_desc_trgm':
+                    raise
+                print(f"[ADVERTENCIA] No se pudo crear el indice de trigramas: {e}")
+    
+    print("[DEBUG] Indices creados correctamente")
     
-    print("[DEBUG] Creando indice idx_comercio_bandera...")
+    print("[DEBUG] Ejecutando VACUUM ANALYZE en productos...")
+    conn.autocommit = True
+    try:
+        cursor.execute('VACUUM (ANALYZE) productos')
+    finally:
+        conn.autocommit = False
+
+
+def agregar_foreign_key_productos(conn):
+    """Agrega la foreign key de productos a comercios después de la carga.
+
+    La constraint se crea NOT VALID (sin revisar las filas ya cargadas) y luego
+    se valida en un paso aparte, que sólo toma un lock SHARE UPDATE EXCLUSIVE.
+    Si hay productos de banderas que no figuran en comercios la validación
+    falla; en ese caso la constraint queda NOT VALID (aplica sólo a filas
+    nuevas) y se informa con una advertencia.
+
+    Args:
+        conn (psycopg2.connection): Conexión a PostgreSQL.
+    """
+    print("[DEBUG] Agregando foreign key fk_productos_comercios...")
+    cursor = conn.cursor()
     cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_comercio_bandera ON productos(id_comercio, id_bandera)
+        ALTER TABLE productos ADD CONSTRAINT fk_productos_comercios
+        FOREIGN KEY (id_comercio, id_bandera) REFERENCES comercios(id_comercio, id_bandera)
+        NOT VALID
     ''')
-    
     conn.commit()
-    print("[DEBUG] Indices creados correctamente")
+    
+    try:
+        cursor.execute('ALTER TABLE productos VALIDATE CONSTRAINT fk_productos_comercios')
+        conn.commit()
+        print("[DEBUG] Foreign key validada")
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"[ADVERTENCIA] No se pudo validar fk_productos_comercios: {e}")
 
 
-def importar_comercios_desde_csv(conn, ruta_csv):
+def importar_comercios_desde_csv(conn, archivo_csv):
     """Importa datos de comercios desde un archivo CSV.
 
     Filtra automáticamente solo los comercios permitidos según COMERCIOS_PERMITIDOS.
-    Utiliza INSERT ... ON CONFLICT para actualizar registros existentes.
+    Las filas válidas se cargan en comercios_staging con un único COPY y luego
+    se pasan a comercios con un INSERT ... ON CONFLICT, en lugar de un INSERT
+    por fila. Si una misma (id_comercio, id_bandera) aparece más de una vez
+    prevalece la última fila del archivo.
 
     Args:
         conn (psycopg2.connection): Conexión a PostgreSQL.
-        ruta_csv (str): Ruta al archivo CSV de comercios.
+        archivo_csv (file): comercio.csv abierto en modo binario (por ejemplo,
+            el miembro de un ZIP abierto con ZipFile.open).
 
     Returns:
-        int: Cantidad de comercios importados.
+        int: Cantidad de comercios (id_comercio, id_bandera) insertados o
+            actualizados en comercios.
     """
-    print(f"  [DEBUG] Iniciando importacion de comercios desde: {os.path.basename(ruta_csv)}")
+    print(f"  [DEBUG] Iniciando importacion de comercios desde: {os.path.basename(archivo_csv.name)}")
     cursor = conn.cursor()
-    contador = 0
+    comercios = {}
     
     try:
-        with open(ruta_csv, 'r', encoding='utf-8-sig') as archivo:
-            lector = csv.DictReader(archivo, delimiter='|')
+        with io.TextIOWrapper(archivo_csv, encoding='utf-8-sig') as archivo:
+            lector = csv.reader(archivo, delimiter='|')
+            columnas = next(lector, [])
+            (i_comercio, i_bandera, i_razon_social,
+             i_bandera_nombre, i_bandera_url) = _indices_columnas(columnas, [
+                'id_comercio', 'id_bandera', 'comercio_razon_social',
+                'comercio_bandera_nombre', 'comercio_bandera_url'])
             print(f"  [DEBUG] Archivo CSV abierto, leyendo filas...")
             
-            for fila in lector:
-                if not fila.get('id_comercio') or fila.get('id_comercio').strip() == '':
+            for valores in lector:
+                # Como en csv.DictReader, los campos que le faltan a la fila
+                # son None (se cargan como NULL).
+                fila = _normalizar_fila(valores, len(columnas), None)
+                
+                id_comercio_valor = fila[i_comercio]
+                if not id_comercio_valor or not id_comercio_valor.strip():
                     continue
                 
                 try:
-                    id_comercio = int(fila['id_comercio'])
+                    id_comercio = int(id_comercio_valor)
                     
                     if id_comercio not in COMERCIOS_PERMITIDOS:
                         continue
                     
-                    id_bandera = int(fila['id_bandera']) if fila.get('id_bandera') and fila.get('id_bandera').strip() else None
-                    
-                    if id_bandera is None:
+                    id_bandera_valor = fila[i_bandera]
+                    if not id_bandera_valor or not id_bandera_valor.strip():
                         continue
+                    id_bandera = int(id_bandera_valor)
                     
-                    cursor.execute('''
-                        INSERT INTO comercios 
-                        (id_comercio, id_bandera, comercio_razon_social, comercio_bandera_nombre, comercio_bandera_url)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (id_comercio, id_bandera) 
-                        DO UPDATE SET
-                            comercio_razon_social = EXCLUDED.comercio_razon_social,
-                            comercio_bandera_nombre = EXCLUDED.comercio_bandera_nombre,
-                            comercio_bandera_url = EXCLUDED.comercio_bandera_url
-                    ''', (
+                    comercios[(id_comercio, id_bandera)] = (
                         id_comercio,
                         id_bandera,
-                        fila.get('comercio_razon_social', ''),
-                        fila.get('comercio_bandera_nombre', ''),
-                        fila.get('comercio_bandera_url', '')
-                    ))
-                    contador += 1
-                except (ValueError, KeyError):
+                        fila[i_razon_social],
+                        fila[i_bandera_nombre],
+                        fila[i_bandera_url]
+                    )
+                except ValueError:
                     continue
         
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter='|').writerows(
+            [r'\N' if valor is None else valor for valor in comercio] for comercio in comercios.values())
+        buffer.seek(0)
+        
+        cursor.execute('TRUNCATE TABLE comercios_staging')
+        cursor.copy_expert(
+            sql.SQL("COPY comercios_staging (id_comercio, id_bandera, comercio_razon_social, comercio_bandera_nombre, comercio_bandera_url) FROM STDIN WITH (FORMAT csv, DELIMITER '|', NULL '\\N')"),
+            buffer
+        )
+        cursor.execute('''
+            INSERT INTO comercios 
+            (id_comercio, id_bandera, comercio_razon_social, comercio_bandera_nombre, comercio_bandera_url)
+            SELECT id_comercio, id_bandera, comercio_razon_social, comercio_bandera_nombre, comercio_bandera_url
+            FROM comercios_staging
+            ON CONFLICT (id_comercio, id_bandera) 
+            DO UPDATE SET
+                comercio_razon_social = EXCLUDED.comercio_razon_social,
+                comercio_bandera_nombre = EXCLUDED.comercio_bandera_nombre,
+                comercio_bandera_url = EXCLUDED.comercio_bandera_url
+        ''')
+        comercios_importados = cursor.rowcount
+        
         conn.commit()
-        print(f"  [DEBUG] Comercios importados: {contador}")
-        return contador
+        print(f"  [DEBUG] Comercios importados: {comercios_importados}")
+        return comercios_importados
     except Exception as e:
-        print(f"Error leyendo {ruta_csv}: {e}")
+        print(f"Error leyendo {archivo_csv.name}: {e}")
+        conn.rollback()
         return 0
 
 
-def preparar_csv_para_copy(ruta_csv_original, ruta_csv_limpio):
+# Tamaño de los buffers de E/S entre el validador y COPY (pipe y mensajes
+# CopyData) y de los bloques que lee pyarrow: con el default de 8 KB de
+# Python, un CSV de varios GB se traduce en millones de syscalls.
+_TAMANO_BUFFER = 1 << 20
+_TAMANO_BLOQUE_CSV = 4 << 20
+
+_COLUMNAS_PRODUCTOS_STAGING = ['id_comercio', 'id_bandera', 'id_producto',
+                               'productos_precio_lista', 'productos_descripcion', 'productos_marca']
+
+# Formatos que int() y float() aceptan en la práctica para los campos del SEPA.
+# El límite de dígitos evita desbordar int64 al castear.
+_PATRON_ENTERO = r'^[+-]?[0-9]{1,18}$'
+_PATRON_DECIMAL = r'^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?$'
+
+
+def _columna_texto(lote, nombre):
+    """Devuelve una columna del lote como texto sin espacios y sin nulos."""
+    return pc.utf8_trim_whitespace(pc.fill_null(lote.column(nombre), ''))
+
+
+def _a_entero(valores):
+    """Castea a int64 los valores con formato entero; el resto queda nulo."""
+    validos = pc.match_substring_regex(valores, _PATRON_ENTERO)
+    sin_signo = pc.replace_substring_regex(valores, r'^\+', '')
+    return validos, pc.cast(pc.if_else(validos, sin_signo, None), pa.int64())
+
+
+# Encabezado y fin del formato binario de COPY: firma, flags y largo de la
+# extensión del encabezado; el fin es un contador de campos de -1.
+_ENCABEZADO_COPY_BINARIO = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_FIN_COPY_BINARIO = struct.pack('>h', -1)
+
+# Prefijos de ancho fijo de cada tupla. Los NUMERIC se envían siempre con 4
+# dígitos base 10000 (peso 2, escala 2); PostgreSQL normaliza los ceros.
+_PREFIJO_TUPLA = np.dtype([('campos', '>i2'), ('largo_comercio', '>i4'), ('id_comercio', '>i4'),
+                           ('largo_bandera', '>i4'), ('id_bandera', '>i4'), ('largo_producto', '>i4')])
+_PREFIJO_PRECIO = np.dtype([('largo', '>i4'), ('ndigitos', '>i2'), ('peso', '>i2'), ('signo', '>i2'),
+                            ('escala', '>i2'), ('digitos', '>i2', (4,)), ('largo_descripcion', '>i4')])
+_PREFIJO_MARCA = np.dtype([('largo_marca', '>i4')])
+
+
+def _a_binario(estructura):
+    """Convierte un arreglo estructurado de numpy en un pa.binary() por fila."""
+    tipo = pa.binary(estructura.dtype.itemsize)
+    fijo = pa.FixedSizeBinaryArray.from_buffers(tipo, len(estructura), [None, pa.py_buffer(estructura.tobytes())])
+    return fijo.cast(pa.binary())
+
+
+def _largos(valores):
+    """Largo en bytes UTF-8 de cada valor; -1 para los nulos (NULL en COPY)."""
+    return pc.fill_null(pc.binary_length(valores), -1).to_numpy(zero_copy_only=False)
+
+
+def _codificar_copy_binario(id_comercio, id_bandera, id_producto, precio_lista, descripcion, marca):
+    """Codifica un lote de productos válidos en el formato binario de COPY.
+
+    Arma cada tupla en forma vectorizada: los campos de ancho fijo se empaquetan
+    con numpy en big-endian y se concatenan con los textos mediante
+    binary_join_element_wise, de modo que el buffer de datos del resultado es
+    directamente la secuencia de tuplas. Se devuelve ese mismo buffer (sin
+    copiarlo a bytes) para escribirlo tal cual en el COPY.
+
+    Args:
+        id_comercio (pa.Array): IDs de comercio (int64).
+        id_bandera (pa.Array): IDs de bandera (int64).
+        id_producto (pa.Array): Códigos de barras (string).
+        precio_lista (pa.Array): Precios (float64).
+        descripcion (pa.Array): Descripciones (string).
+        marca (pa.Array): Marcas (string, nulo si no tiene).
+
+    Returns:
+        pa.Buffer: Tuplas codificadas, sin encabezado ni fin.
+    """
+    filas = len(id_comercio)
+    if filas == 0:
+        return b''
+    
+    prefijo = np.zeros(filas, dtype=_PREFIJO_TUPLA)
+    prefijo['campos'] = len(_COLUMNAS_PRODUCTOS_STAGING)
+    prefijo['largo_comercio'] = 4
+    prefijo['id_comercio'] = pc.cast(id_comercio, pa.int32()).to_numpy(zero_copy_only=False)
+    prefijo['largo_bandera'] = 4
+    prefijo['id_bandera'] = pc.cast(id_bandera, pa.int32()).to_numpy(zero_copy_only=False)
+    prefijo['largo_producto'] = _largos(id_producto)
+    
+    # El precio se redondea a 2 decimales sobre su representación decimal más
+    # corta (la misma que recibiría COPY en texto), con redondeo "half away
+    # from zero" como NUMERIC. Los valores absurdamente grandes se acotan para
+    # que PostgreSQL rechace el COPY por dígito inválido, como antes rechazaba
+    # el desborde de NUMERIC(10,2).
+    absoluto = pc.abs(precio_lista)
+    absoluto = pc.if_else(pc.less(absoluto, 1e-6), 0.0, pc.min_element_wise(absoluto, 1e12))
+    decimal = pc.cast(pc.cast(absoluto, pa.string()), pa.decimal128(38, 12))
+    centavos = pc.cast(pc.round(decimal, 2, round_mode='half_towards_infinity'), pa.decimal128(20, 2))
+    centavos = pc.cast(pc.multiply(centavos, pa.scalar(100, pa.decimal128(3, 0))), pa.int64())
+    centavos = centavos.to_numpy(zero_copy_only=False)
+    enteros = centavos // 100
+    
+    precio = np.zeros(filas, dtype=_PREFIJO_PRECIO)
+    precio['largo'] = 16
+    precio['ndigitos'] = 4
+    precio['peso'] = 2
+    precio['signo'] = np.where(pc.less(precio_lista, 0.0).to_numpy(zero_copy_only=False) & (centavos > 0), 0x4000, 0)
+    precio['escala'] = 2
+    precio['digitos'] = np.stack([enteros // 100000000, enteros // 10000 % 10000,
+                                  enteros % 10000, centavos % 100 * 100], axis=1)
+    precio['largo_descripcion'] = _largos(descripcion)
+    
+    largo_marca = np.zeros(filas, dtype=_PREFIJO_MARCA)
+    largo_marca['largo_marca'] = _largos(marca)
+    
+    tuplas = pc.binary_join_element_wise(
+        _a_binario(prefijo), id_producto.cast(pa.binary()),
+        _a_binario(precio), descripcion.cast(pa.binary()),
+        _a_binario(largo_marca), pc.fill_null(marca, '').cast(pa.binary()),
+        b''
+    )
+    return tuplas.buffers()[2].slice(0, pc.sum(pc.binary_length(tuplas)).as_py())
+
+
+def _indices_columnas(columnas, nombres):
+    """Posiciones de las columnas pedidas dentro del encabezado de un CSV.
+
+    Las columnas que no están en el encabezado apuntan a la posición
+    len(columnas), que _normalizar_fila deja siempre en ''.
+
+    Args:
+        columnas (list): Encabezado del CSV.
+        nombres (list): Columnas a ubicar.
+
+    Returns:
+        list: Posición de cada columna pedida, en el mismo orden.
+    """
+    posiciones = {nombre: i for i, nombre in enumerate(columnas)}
+    return [posiciones.get(nombre, len(columnas)) for nombre in nombres]
+
+
+def _normalizar_fila(valores, ancho, relleno):
+    """Ajusta una fila al ancho del encabezado, como lo haría csv.DictReader.
+
+    Descarta los campos sobrantes, completa los faltantes con relleno y agrega
+    al final el '' de las columnas ausentes del encabezado.
+    """
+    return valores[:ancho] + [relleno] * (ancho - len(valores)) + ['']
+
+
+def _validar_fila_producto(fila, indices, errores):
+    """Valida una fila de productos.csv ya separada en campos.
+
+    Se usa para las filas que pyarrow no puede tokenizar (por ejemplo, el
+    pie "Última actualización" o filas con columnas de más o de menos), con
+    las mismas reglas que la validación vectorizada.
+
+    Args:
+        fila (list): Campos de la fila normalizada con _normalizar_fila.
+        indices (list): Posiciones de id_producto, id_comercio, id_bandera,
+            precio, descripción y marca (ver _indices_columnas).
+        errores (dict): Contadores de errores a actualizar.
+
+    Returns:
+        list: Fila lista para el CSV limpio, o None si no es válida.
+    """
+    i_producto, i_comercio, i_bandera, i_precio, i_descripcion, i_marca = indices
+    
+    id_producto = fila[i_producto].strip()
+    if not id_producto:
+        errores['sin_id_producto'] += 1
+        return None
+    
+    try:
+        id_comercio = int(fila[i_comercio])
+    except ValueError:
+        errores['otros'] += 1
+        return None
+    
+    if id_comercio not in COMERCIOS_PERMITIDOS:
+        errores['id_comercio_no_permitido'] += 1
+        return None
+    
+    try:
+        id_bandera = int(fila[i_bandera])
+    except ValueError:
+        errores['sin_id_bandera'] += 1
+        return None
+    
+    try:
+        precio_lista = float(fila[i_precio])
+    except ValueError:
+        errores['sin_precio'] += 1
+        return None
+    
+    descripcion = fila[i_descripcion].strip()
+    if not descripcion:
+        errores['sin_descripcion'] += 1
+        return None
+    
+    marca = fila[i_marca].strip()
+    return [id_comercio, id_bandera, id_producto, precio_lista, descripcion, marca]
+
+
+def preparar_csv_para_copy(archivo_entrada, archivo_salida):
     """Prepara un CSV limpio y validado para carga masiva con COPY.
 
     Valida y filtra los datos del CSV original, manteniendo solo filas válidas
     de comercios permitidos. Genera estadísticas de errores por tipo.
 
+    El CSV se lee por bloques con pyarrow.csv y la validación se resuelve con
+    kernels vectorizados de pyarrow.compute sobre cada bloque, en lugar de
+    recorrer las filas en Python. Las filas que pyarrow no puede tokenizar se
+    validan aparte con _validar_fila_producto. La salida está en el formato
+    binario de COPY, para que PostgreSQL no tenga que volver a parsear texto.
+
     Args:
-        ruta_csv_original (str): Ruta al CSV original con todos los productos.
-        ruta_csv_limpio (str): Ruta donde se guardará el CSV limpio.
+        archivo_entrada (file): CSV original con todos los productos, abierto
+            en modo binario (por ejemplo, el miembro de un ZIP).
+        archivo_salida (file): Archivo binario abierto donde se escriben las
+            filas limpias (por ejemplo, el extremo de escritura de un pipe).
 
     Returns:
         tuple: (filas_validas, errores) donde:
@@ -249,133 +680,182 @@ def preparar_csv_para_copy(ruta_csv_original, ruta_csv_limpio):
         'otros': 0
     }
     
-    with open(ruta_csv_original, 'r', encoding='utf-8-sig') as archivo_entrada:
-        lector = csv.DictReader(archivo_entrada, delimiter='|')
+    # La salida es siempre un stream COPY válido (encabezado y fin), aunque no
+    # tenga filas: COPY rechaza un stream vacío por firma no reconocida.
+    archivo_salida.write(_ENCABEZADO_COPY_BINARIO)
+    
+    # El encabezado se lee a mano (y con utf-8-sig, por el BOM) para detectar
+    # la columna de id_comercio; el resto del stream se pasa a pyarrow.
+    encabezado = archivo_entrada.readline().decode('utf-8-sig')
+    columnas = next(csv.reader([encabezado], delimiter='|'), None)
+    
+    if not columnas:
+        print(f"  [ERROR] No se pudieron leer las columnas del CSV!")
+        archivo_salida.write(_FIN_COPY_BINARIO)
+        return 0, errores
+    
+    id_comercio_key = None
+    for col in columnas:
+        if 'id_comercio' in col.lower().replace(' ', '').replace('\ufeff', ''):
+            id_comercio_key = col
+            break
+    
+    if not id_comercio_key:
+        print(f"  [ERROR] Columna 'id_comercio' no encontrada!")
+        archivo_salida.write(_FIN_COPY_BINARIO)
+        return 0, errores
+    
+    incluidas = list(dict.fromkeys([id_comercio_key, 'id_bandera', 'id_producto', 'productos_precio_lista',
+                                    'productos_descripcion', 'productos_marca']))
+    filas_invalidas = []
+    
+    def registrar_fila_invalida(fila):
+        filas_invalidas.append(fila.text)
+        return 'skip'
+    
+    try:
+        lector = pacsv.open_csv(
+            archivo_entrada,
+            read_options=pacsv.ReadOptions(column_names=columnas, block_size=_TAMANO_BLOQUE_CSV),
+            parse_options=pacsv.ParseOptions(delimiter='|', newlines_in_values=True,
+                                             invalid_row_handler=registrar_fila_invalida),
+            convert_options=pacsv.ConvertOptions(column_types={c: pa.string() for c in incluidas},
+                                                 include_columns=incluidas,
+                                                 include_missing_columns=True)
+        )
+    except pa.ArrowInvalid as e:
+        # Un CSV con sólo el encabezado no tiene filas que leer.
+        if 'Empty CSV file' not in str(e):
+            raise
+        lector = []
+    
+    permitidos = pa.array(sorted(COMERCIOS_PERMITIDOS), type=pa.int64())
+    
+    for lote in lector:
+        total_filas += lote.num_rows
         
-        columnas = lector.fieldnames
-        if not columnas:
-            print(f"  [ERROR] No se pudieron leer las columnas del CSV!")
-            return 0, errores
+        id_producto = _columna_texto(lote, 'id_producto')
+        pendientes = pc.not_equal(id_producto, '')
+        errores['sin_id_producto'] += lote.num_rows - pc.sum(pendientes).as_py()
         
-        id_comercio_key = None
-        for col in columnas:
-            if 'id_comercio' in col.lower().replace(' ', '').replace('\ufeff', ''):
-                id_comercio_key = col
-                break
+        comercio_ok, id_comercio = _a_entero(_columna_texto(lote, id_comercio_key))
+        errores['otros'] += pc.sum(pc.and_not(pendientes, comercio_ok)).as_py()
+        pendientes = pc.and_(pendientes, comercio_ok)
         
-        if not id_comercio_key:
-            print(f"  [ERROR] Columna 'id_comercio' no encontrada!")
-            return 0, errores
+        permitido = pc.fill_null(pc.is_in(id_comercio, value_set=permitidos), False)
+        errores['id_comercio_no_permitido'] += pc.sum(pc.and_not(pendientes, permitido)).as_py()
+        pendientes = pc.and_(pendientes, permitido)
         
-        with open(ruta_csv_limpio, 'w', encoding='utf-8', newline='') as archivo_salida:
-            escritor = csv.writer(archivo_salida, delimiter='|')
-            
-            escritor.writerow(['id_comercio', 'id_bandera', 'id_producto', 
-                             'productos_precio_lista', 'productos_descripcion', 'productos_marca'])
-            
-            for fila in lector:
-                total_filas += 1
-                
-                id_producto = fila.get('id_producto', '').strip() if fila.get('id_producto') else ''
-                if not id_producto:
-                    errores['sin_id_producto'] += 1
-                    continue
-                
-                id_comercio_valor = fila.get(id_comercio_key, '').strip() if fila.get(id_comercio_key) else ''
-                if not id_comercio_valor:
-                    errores['otros'] += 1
-                    continue
-                
-                try:
-                    id_comercio = int(id_comercio_valor)
-                except ValueError:
-                    errores['otros'] += 1
-                    continue
-                
-                if id_comercio not in COMERCIOS_PERMITIDOS:
-                    errores['id_comercio_no_permitido'] += 1
-                    continue
-                
-                id_bandera_str = fila.get('id_bandera', '').strip() if fila.get('id_bandera') else ''
-                if not id_bandera_str:
-                    errores['sin_id_bandera'] += 1
-                    continue
-                
-                try:
-                    id_bandera = int(id_bandera_str)
-                except ValueError:
-                    errores['sin_id_bandera'] += 1
-                    continue
-                
-                precio_str = fila.get('productos_precio_lista', '').strip() if fila.get('productos_precio_lista') else ''
-                if not precio_str:
-                    errores['sin_precio'] += 1
-                    continue
-                
-                try:
-                    precio_lista = float(precio_str)
-                except ValueError:
-                    errores['sin_precio'] += 1
-                    continue
-                
-                descripcion = fila.get('productos_descripcion', '').strip() if fila.get('productos_descripcion') else ''
-                if not descripcion:
-                    errores['sin_descripcion'] += 1
-                    continue
-                
-                marca = fila.get('productos_marca', '').strip() if fila.get('productos_marca') else ''
-                
-                escritor.writerow([id_comercio, id_bandera, id_producto, precio_lista, descripcion, marca])
-                filas_validas += 1
-                
-                if filas_validas % 100000 == 0:
-                    print(f"  [DEBUG] Procesadas {filas_validas} filas válidas...")
+        bandera_ok, id_bandera = _a_entero(_columna_texto(lote, 'id_bandera'))
+        errores['sin_id_bandera'] += pc.sum(pc.and_not(pendientes, bandera_ok)).as_py()
+        pendientes = pc.and_(pendientes, bandera_ok)
+        
+        precio_str = _columna_texto(lote, 'productos_precio_lista')
+        precio_ok = pc.match_substring_regex(precio_str, _PATRON_DECIMAL)
+        errores['sin_precio'] += pc.sum(pc.and_not(pendientes, precio_ok)).as_py()
+        pendientes = pc.and_(pendientes, precio_ok)
+        precio_lista = pc.cast(pc.if_else(precio_ok, precio_str, None), pa.float64())
+        
+        descripcion = _columna_texto(lote, 'productos_descripcion')
+        descripcion_ok = pc.not_equal(descripcion, '')
+        errores['sin_descripcion'] += pc.sum(pc.and_not(pendientes, descripcion_ok)).as_py()
+        pendientes = pc.and_(pendientes, descripcion_ok)
+        
+        # Una marca vacía se carga como NULL, igual que con el CSV de texto.
+        marca = _columna_texto(lote, 'productos_marca')
+        marca = pc.if_else(pc.equal(marca, ''), None, marca)
+        
+        limpio = pa.record_batch([id_comercio, id_bandera, id_producto, precio_lista, descripcion, marca],
+                                 names=_COLUMNAS_PRODUCTOS_STAGING).filter(pendientes)
+        archivo_salida.write(_codificar_copy_binario(*limpio.columns))
+        
+        anteriores = filas_validas
+        filas_validas += limpio.num_rows
+        if filas_validas // 100000 > anteriores // 100000:
+            print(f"  [DEBUG] Procesadas {filas_validas} filas válidas...")
+    
+    if filas_invalidas:
+        indices = _indices_columnas(columnas, ['id_producto', id_comercio_key, 'id_bandera',
+                                               'productos_precio_lista', 'productos_descripcion',
+                                               'productos_marca'])
+        recuperadas = []
+        for valores in csv.reader(filas_invalidas, delimiter='|'):
+            total_filas += 1
+            fila = _validar_fila_producto(_normalizar_fila(valores, len(columnas), ''), indices, errores)
+            if fila is not None:
+                recuperadas.append(fila)
+        
+        if recuperadas:
+            tipos = [pa.int64(), pa.int64(), pa.string(), pa.float64(), pa.string(), pa.string()]
+            valores = [pa.array([fila[i] for fila in recuperadas], type=tipo) for i, tipo in enumerate(tipos)]
+            valores[5] = pc.if_else(pc.equal(valores[5], ''), None, valores[5])
+            archivo_salida.write(_codificar_copy_binario(*valores))
+            filas_validas += len(recuperadas)
+    
+    archivo_salida.write(_FIN_COPY_BINARIO)
     
     print(f"  [DEBUG] CSV preparado: {filas_validas} filas válidas de {total_filas} totales")
     return filas_validas, errores
 
 
-def importar_productos_desde_csv(conn, ruta_csv):
+def importar_productos_desde_csv(conn, archivo_csv):
     """Importa productos desde CSV usando COPY de PostgreSQL para carga masiva.
 
     Utiliza COPY para cargar datos directamente en la tabla staging, lo cual
-    es significativamente más rápido que INSERT individuales.
+    es significativamente más rápido que INSERT individuales. La validación
+    corre en un hilo que escribe las filas limpias (en el formato binario de
+    COPY) en un pipe mientras COPY las consume del otro extremo, sin
+    materializar un archivo intermedio.
 
     Args:
         conn (psycopg2.connection): Conexión a PostgreSQL.
-        ruta_csv (str): Ruta al archivo CSV de productos.
+        archivo_csv (file): productos.csv abierto en modo binario (por ejemplo,
+            el miembro de un ZIP abierto con ZipFile.open).
 
     Returns:
         tuple: (filas_importadas, total_errores) donde:
             - filas_importadas (int): Cantidad de filas cargadas exitosamente.
             - total_errores (int): Total de filas rechazadas por validación.
     """
-    print(f"  [DEBUG] Iniciando importacion de productos desde: {os.path.basename(ruta_csv)}")
+    print(f"  [DEBUG] Iniciando importacion de productos desde: {os.path.basename(archivo_csv.name)}")
     cursor = conn.cursor()
     
-    temp_csv = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', encoding='utf-8')
-    temp_csv.close()
+    lectura, escritura = os.pipe()
+    resultado = {}
+    
+    def validar():
+        try:
+            with os.fdopen(escritura, 'wb', buffering=_TAMANO_BUFFER) as salida:
+                resultado['valor'] = preparar_csv_para_copy(archivo_csv, salida)
+        except BaseException as e:
+            resultado['error'] = e
+    
+    hilo = threading.Thread(target=validar, daemon=True)
+    hilo.start()
     
     try:
-        filas_validas, errores = preparar_csv_para_copy(ruta_csv, temp_csv.name)
+        print(f"  [DEBUG] Cargando filas a staging usando COPY...")
+        with os.fdopen(lectura, 'rb', buffering=_TAMANO_BUFFER) as entrada:
+            cursor.copy_expert(
+                sql.SQL("COPY productos_staging (id_comercio, id_bandera, id_producto, productos_precio_lista, productos_descripcion, productos_marca) FROM STDIN WITH (FORMAT binary)"),
+                entrada,
+                size=_TAMANO_BUFFER
+            )
+        hilo.join()
+        
+        if 'error' in resultado:
+            raise resultado['error']
+        
+        filas_validas, errores = resultado['valor']
+        total_errores = sum(errores.values())
         
         if filas_validas == 0:
             print(f"  [DEBUG] No hay filas válidas para importar")
-            os.unlink(temp_csv.name)
-            total_errores = sum(errores.values())
+            conn.rollback()
             return 0, total_errores
         
-        print(f"  [DEBUG] Cargando {filas_validas} filas a staging usando COPY...")
-        with open(temp_csv.name, 'r', encoding='utf-8') as f:
-            cursor.copy_expert(
-                sql.SQL("COPY productos_staging (id_comercio, id_bandera, id_producto, productos_precio_lista, productos_descripcion, productos_marca) FROM STDIN WITH (FORMAT csv, DELIMITER '|', HEADER true, ENCODING 'utf8')"),
-                f
-            )
-        
         conn.commit()
         print(f"  [DEBUG] {filas_validas} filas cargadas a staging")
-        
-        total_errores = sum(errores.values())
         return filas_validas, total_errores
         
     except Exception as e:
@@ -385,53 +865,177 @@ def importar_productos_desde_csv(conn, ruta_csv):
         conn.rollback()
         return 0, 0
     finally:
-        if os.path.exists(temp_csv.name):
-            os.unlink(temp_csv.name)
+        # Si COPY falló antes de agotar el pipe, cerrar el extremo de lectura
+        # (al salir del with) hace que el hilo termine con BrokenPipeError.
+        hilo.join()
+
+
+def _buscar_miembro_zip(zip_ref, nombre):
+    """Devuelve el primer miembro del ZIP con ese nombre de archivo, o None."""
+    for miembro in zip_ref.namelist():
+        if miembro == nombre or miembro.endswith('/' + nombre):
+            return miembro
+    return None
+
+
+def importar_productos_de_zip(ruta_zip_comercio):
+    """Lee productos.csv de un ZIP de comercio y lo carga a staging.
+
+    Está pensada para ejecutarse en un proceso del pool de la fase 3, por lo
+    que abre su propia conexión. El CSV se descomprime en streaming desde el
+    ZIP, sin extraerlo a disco.
+
+    Args:
+        ruta_zip_comercio (str): Ruta al ZIP de un comercio.
+
+    Returns:
+        tuple: (filas_importadas, total_errores) de importar_productos_desde_csv,
+            o None si el ZIP no contiene productos.csv.
+    """
+    conn = conectar_postgresql()
+    
+    try:
+        with zipfile.ZipFile(ruta_zip_comercio, 'r') as zip_ref:
+            miembro = _buscar_miembro_zip(zip_ref, 'productos.csv')
+            if not miembro:
+                return None
+            
+            with zip_ref.open(miembro) as archivo_csv:
+                return importar_productos_desde_csv(conn, archivo_csv)
+    finally:
+        conn.close()
+
+
+_PREFIJO_ZIP_COMERCIO = 'comercio-sepa-'
+_DIGITOS = '0123456789'
+
+
+def _es_zip_de_comercio_permitido(nombre):
+    """Indica si un ZIP de comercio corresponde a COMERCIOS_PERMITIDOS.
+
+    Los nombres tienen la forma comercio-sepa-<id>_<fecha>.zip; el id son los
+    dígitos que siguen al prefijo.
+    """
+    nombre = os.path.basename(nombre)
+    inicio = nombre.find(_PREFIJO_ZIP_COMERCIO)
+    if inicio < 0:
+        return False
+    
+    resto = nombre[inicio + len(_PREFIJO_ZIP_COMERCIO):]
+    digitos = resto[:len(resto) - len(resto.lstrip(_DIGITOS))]
+    return bool(digitos) and int(digitos) in COMERCIOS_PERMITIDOS
+
+
+def _es_carpeta_fecha(nombre):
+    """Indica si un nombre tiene el formato YYYY-MM-DD."""
+    return (len(nombre) == 10 and nombre[4] == '-' and nombre[7] == '-'
+            and (nombre[:4] + nombre[5:7] + nombre[8:]).strip(_DIGITOS) == '')
+
+
+def _extraer_miembros(ruta_zip, miembros, destino):
+    """Extrae una parte de los miembros de un ZIP con su propio ZipFile.
+
+    ZipFile no es seguro entre threads, así que cada thread del pool de
+    descomprimir_zip_principal abre el archivo por separado.
+    """
+    with zipfile.ZipFile(ruta_zip, 'r') as zip_ref:
+        for info in miembros:
+            zip_ref.extract(info, destino)
+
+
+def _directorio_extraccion(bytes_necesarios):
+    """Elige dónde extraer el ZIP principal.
+
+    Usa SEPA_TMPDIR si está configurado. Si no, prefiere /dev/shm (tmpfs, en
+    RAM) cuando tiene espacio libre para todo lo que se va a extraer; en otro
+    caso devuelve None para que tempfile use el directorio del sistema.
+
+    Args:
+        bytes_necesarios (int): Tamaño descomprimido de los miembros a extraer.
+
+    Returns:
+        str: Directorio base para tempfile.mkdtemp, o None.
+    """
+    if SEPA_TMPDIR:
+        return SEPA_TMPDIR
+    if os.path.isdir('/dev/shm') and shutil.disk_usage('/dev/shm').free > bytes_necesarios:
+        return '/dev/shm'
+    return None
 
 
 def descomprimir_zip_principal(ruta_zip):
     """Descomprime el ZIP principal del SEPA y localiza la carpeta con fecha.
 
     El ZIP principal contiene una carpeta con formato YYYY-MM-DD que a su vez
-    contiene múltiples ZIPs de comercios individuales.
+    contiene múltiples ZIPs de comercios individuales. Los miembros son
+    independientes entre sí, así que se extraen en paralelo con un pool de
+    threads (zlib y la escritura a disco liberan el GIL).
+
+    Los ZIPs de comercios que no están en COMERCIOS_PERMITIDOS (o cuyo nombre
+    no sigue el formato comercio-sepa-<id>) no se extraen. El directorio
+    temporal se crea según _directorio_extraccion (en RAM si hay lugar).
 
     Args:
         ruta_zip (str): Ruta al archivo ZIP principal del SEPA.
 
     Returns:
-        str: Ruta a la carpeta con formato fecha (YYYY-MM-DD) o None si hay error.
+        tuple: (carpeta, zips_omitidos) donde:
+            - carpeta (str): Ruta a la carpeta con formato fecha (YYYY-MM-DD),
+              o None si hay error.
+            - zips_omitidos (int): Cantidad de ZIPs de otros comercios que no
+              se extrajeron.
     """
     print(f"[DEBUG] Descomprimiendo {ruta_zip}...")
     
-    temp_dir = tempfile.mkdtemp(prefix='sepa_import_')
-    print(f"[DEBUG] Directorio temporal creado: {temp_dir}")
-    
     try:
         tamaño_zip = os.path.getsize(ruta_zip)
         print(f"[DEBUG] Tamaño del ZIP principal: {tamaño_zip / (1024*1024):.2f} MB")
         
         with zipfile.ZipFile(ruta_zip, 'r') as zip_ref:
-            total_archivos = len(zip_ref.namelist())
-            print(f"[DEBUG] Total de archivos en ZIP: {total_archivos}")
-            print(f"[DEBUG] Extrayendo archivos...")
-            zip_ref.extractall(temp_dir)
-            print(f"[DEBUG] Extraccion completada")
+            todos = zip_ref.infolist()
+        
+        miembros = [info for info in todos
+                    if not info.filename.endswith('.zip') or _es_zip_de_comercio_permitido(info.filename)]
+        zips_omitidos = len(todos) - len(miembros)
+        
+        temp_dir = tempfile.mkdtemp(prefix='sepa_import_',
+                                    dir=_directorio_extraccion(sum(info.file_size for info in miembros)))
+        print(f"[DEBUG] Directorio temporal creado: {temp_dir}")
+        
+        total_archivos = len(todos)
+        print(f"[DEBUG] Total de archivos en ZIP: {total_archivos}")
+        print(f"[DEBUG] Extrayendo {len(miembros)} archivos...")
+        
+        # Las carpetas se crean antes de repartir el trabajo: ZipFile.extract
+        # las crea con os.makedirs sin exist_ok y dos threads podrían chocar.
+        for info in miembros:
+            partes = [p for p in info.filename.split('/')[:-1] if p not in ('', '.', '..')]
+            os.makedirs(os.path.join(temp_dir, *partes), exist_ok=True)
+        
+        # Reparto round-robin de mayor a menor tamaño para balancear los threads.
+        miembros.sort(key=lambda info: info.file_size, reverse=True)
+        cantidad_threads = max(1, min(len(miembros), os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=cantidad_threads) as pool:
+            tareas = [pool.submit(_extraer_miembros, ruta_zip, miembros[i::cantidad_threads], temp_dir)
+                      for i in range(cantidad_threads)]
+            for tarea in tareas:
+                tarea.result()
+        print(f"[DEBUG] Extraccion completada")
         
         print(f"[DEBUG] Buscando carpeta con formato fecha...")
-        fecha_pattern = re.compile(r'^\d{4}-\d{2}-\d{2}$')
         for item in os.listdir(temp_dir):
             item_path = os.path.join(temp_dir, item)
-            if os.path.isdir(item_path) and fecha_pattern.match(item):
+            if os.path.isdir(item_path) and _es_carpeta_fecha(item):
                 print(f"[DEBUG] Carpeta encontrada: {item}")
-                return item_path
+                return item_path, zips_omitidos
         
         print(f"[DEBUG] No se encontro carpeta con formato fecha, usando directorio temporal")
-        return temp_dir
+        return temp_dir, zips_omitidos
     except Exception as e:
         print(f"Error descomprimiendo ZIP principal: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        return None, 0
 
 
 def procesar_zip_sepa(ruta_zip_principal='data/sepa_jueves.zip'):
@@ -440,9 +1044,11 @@ def procesar_zip_sepa(ruta_zip_principal='data/sepa_jueves.zip'):
     Ejecuta el proceso completo de importación en 5 fases:
     1. Creación/verificación de tablas y limpieza de datos existentes.
     2. Importación de comercios desde todos los ZIPs.
-    3. Importación de productos a tabla staging usando COPY.
+    3. Importación de productos a tabla staging usando COPY, procesando los
+       ZIPs de comercios en paralelo (un proceso y una conexión por ZIP).
     4. Transferencia de datos de staging a tabla final eliminando duplicados.
-    5. Creación de índices para optimizar búsquedas.
+    5. Creación de índices para optimizar búsquedas y de la foreign key de
+       productos a comercios.
 
     Args:
         ruta_zip_principal (str, optional): Ruta al archivo ZIP principal.
@@ -469,33 +1075,21 @@ def procesar_zip_sepa(ruta_zip_principal='data/sepa_jueves.zip'):
     cursor.execute('TRUNCATE TABLE productos CASCADE')
     cursor.execute('TRUNCATE TABLE comercios CASCADE')
     cursor.execute('TRUNCATE TABLE productos_staging')
+    cursor.execute('TRUNCATE TABLE comercios_staging')
     conn.commit()
     print("[FASE 1] Tablas limpiadas\n")
     
-    carpeta_fecha = descomprimir_zip_principal(ruta_zip_principal)
+    carpeta_fecha, zips_omitidos = descomprimir_zip_principal(ruta_zip_principal)
     if not carpeta_fecha:
         print("Error: No se pudo descomprimir el ZIP principal")
         conn.close()
         return
     
-    zips_comercios = []
-    zips_omitidos = 0
+    # Sólo se extrajeron los ZIPs de comercios permitidos.
+    zips_comercios = [os.path.join(carpeta_fecha, item)
+                      for item in os.listdir(carpeta_fecha) if item.endswith('.zip')]
     
-    patron_comercio = re.compile(r'comercio-sepa-(\d+)')
-    
-    for item in os.listdir(carpeta_fecha):
-        if item.endswith('.zip'):
-            match = patron_comercio.search(item)
-            if match:
-                id_comercio_archivo = int(match.group(1))
-                if id_comercio_archivo in COMERCIOS_PERMITIDOS:
-                    zips_comercios.append(os.path.join(carpeta_fecha, item))
-                else:
-                    zips_omitidos += 1
-            else:
-                zips_omitidos += 1
-    
-    print(f"\nComercios permitidos: {COMERCIOS_PERMITIDOS}")
+    print(f"\nComercios permitidos: {sorted(COMERCIOS_PERMITIDOS)}")
     print(f"Encontrados {len(zips_comercios)} archivos ZIP de comercios permitidos")
     if zips_omitidos > 0:
         print(f"Omitidos {zips_omitidos} ZIPs de otros comercios")
@@ -504,8 +1098,10 @@ def procesar_zip_sepa(ruta_zip_principal='data/sepa_jueves.zip'):
     total_productos = 0
     total_errores = 0
     total_comercios = 0
-    
-    temp_extract_dir = tempfile.mkdtemp(prefix='sepa_extract_')
+    # Suma de filas insertadas o actualizadas por cada comercio.csv (sin
+    # COUNT(*) al final); una misma (id_comercio, id_bandera) repetida en dos
+    # ZIPs se cuenta dos veces.
+    total_comercios_importados = 0
     
     print("[FASE 2] Importando comercios...")
     print("="*70)
@@ -513,32 +1109,15 @@ def procesar_zip_sepa(ruta_zip_principal='data/sepa_jueves.zip'):
     for i, zip_comercio in enumerate(zips_comercios, 1):
         print(f"\n[{i}/{len(zips_comercios)}] Procesando comercio: {os.path.basename(zip_comercio)}...")
         
-        for item in os.listdir(temp_extract_dir):
-            item_path = os.path.join(temp_extract_dir, item)
-            if os.path.isfile(item_path):
-                os.remove(item_path)
-            elif os.path.isdir(item_path):
-                shutil.rmtree(item_path)
-        
         try:
-            nombre_zip = os.path.basename(zip_comercio)
             with zipfile.ZipFile(zip_comercio, 'r') as zip_ref:
-                zip_ref.extractall(temp_extract_dir)
-            
-            ruta_comercio_csv = None
-            for root, dirs, files in os.walk(temp_extract_dir):
-                for file in files:
-                    if file == 'comercio.csv':
-                        ruta_comercio_csv = os.path.join(root, file)
-                        break
-                if ruta_comercio_csv:
-                    break
-            
-            if ruta_comercio_csv and os.path.exists(ruta_comercio_csv):
-                importar_comercios_desde_csv(conn, ruta_comercio_csv)
-                print(f"  OK - Comercio importado")
-            else:
-                print(f"  ADVERTENCIA - No se encontro comercio.csv")
+                miembro = _buscar_miembro_zip(zip_ref, 'comercio.csv')
+                if miembro:
+                    with zip_ref.open(miembro) as archivo_csv:
+                        total_comercios_importados += importar_comercios_desde_csv(conn, archivo_csv)
+                    print(f"  OK - Comercio importado")
+                else:
+                    print(f"  ADVERTENCIA - No se encontro comercio.csv")
         except Exception as e:
             print(f"  ERROR - {e}")
     
@@ -548,46 +1127,39 @@ def procesar_zip_sepa(ruta_zip_principal='data/sepa_jueves.zip'):
     print("[FASE 3] Importando productos (esta fase puede tardar varios minutos)...")
     print("="*70)
     
-    for i, zip_comercio in enumerate(zips_comercios, 1):
-        print(f"\n[{i}/{len(zips_comercios)}] Procesando productos: {os.path.basename(zip_comercio)}...")
-        
-        for item in os.listdir(temp_extract_dir):
-            item_path = os.path.join(temp_extract_dir, item)
-            if os.path.isfile(item_path):
-                os.remove(item_path)
-            elif os.path.isdir(item_path):
-                shutil.rmtree(item_path)
+    # Cada ZIP se procesa en un proceso separado con su propia conexión, de
+    # modo que la validación (CPU) y los COPY a staging corren en paralelo.
+    max_procesos = max(1, min(len(zips_comercios), os.cpu_count() or 1))
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_procesos, mp_context=contexto) as pool:
+        futuros = {pool.submit(importar_productos_de_zip, zip_comercio): zip_comercio
+                   for zip_comercio in zips_comercios}
         
-        try:
-            nombre_zip = os.path.basename(zip_comercio)
-            with zipfile.ZipFile(zip_comercio, 'r') as zip_ref:
-                zip_ref.extractall(temp_extract_dir)
+        for i, futuro in enumerate(as_completed(futuros), 1):
+            zip_comercio = futuros[futuro]
+            print(f"\n[{i}/{len(zips_comercios)}] Productos procesados: {os.path.basename(zip_comercio)}...")
             
-            ruta_productos_csv = None
-            for root, dirs, files in os.walk(temp_extract_dir):
-                for file in files:
-                    if file == 'productos.csv':
-                        ruta_productos_csv = os.path.join(root, file)
-                        break
-                if ruta_productos_csv:
-                    break
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                print(f"  ERROR - {e}")
+                import traceback
+                traceback.print_exc()
+                continue
             
-            if ruta_productos_csv and os.path.exists(ruta_productos_csv):
-                productos, errores = importar_productos_desde_csv(conn, ruta_productos_csv)
-                total_productos += productos
-                total_errores += errores
-                total_comercios += 1
-                
-                if productos > 0:
-                    print(f"  OK - {productos} productos importados")
-                else:
-                    print(f"  ADVERTENCIA - Sin productos")
-            else:
+            if resultado is None:
                 print(f"  ADVERTENCIA - No se encontro productos.csv")
-        except Exception as e:
-            print(f"  ERROR - {e}")
-            import traceback
-            traceback.print_exc()
+                continue
+            
+            productos, errores = resultado
+            total_productos += productos
+            total_errores += errores
+            total_comercios += 1
+            
+            if productos > 0:
+                print(f"  OK - {productos} productos importados")
+            else:
+                print(f"  ADVERTENCIA - Sin productos")
     
     print(f"\n[FASE 3] Productos cargados a staging\n")
     
@@ -599,22 +1171,21 @@ def procesar_zip_sepa(ruta_zip_principal='data/sepa_jueves.zip'):
     print("[FASE 5] Creando indices en tabla productos...")
     print("="*70)
     crear_indices_productos(conn)
+    agregar_foreign_key_productos(conn)
     print("[FASE 5] Indices creados\n")
     
-    shutil.rmtree(temp_extract_dir)
-    shutil.rmtree(os.path.dirname(carpeta_fecha))
-    
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM productos')
-    total_productos_db = cursor.fetchone()[0]
-    cursor.execute('SELECT COUNT(*) FROM comercios')
-    total_comercios_db = cursor.fetchone()[0]
+    # carpeta_fecha es el directorio temporal mismo si el ZIP no traía carpeta
+    # con fecha; en ese caso no hay que borrar su padre (/tmp o /dev/shm).
+    if _es_carpeta_fecha(os.path.basename(carpeta_fecha)):
+        shutil.rmtree(os.path.dirname(carpeta_fecha))
+    else:
+        shutil.rmtree(carpeta_fecha)
     
     print(f"\n{'='*60}")
     print(f"Importación completada:")
     print(f"  - ZIPs procesados: {total_comercios}")
-    print(f"  - Comercios únicos (id_comercio, id_bandera): {total_comercios_db}")
-    print(f"  - Productos totales: {total_productos_db}")
+    print(f"  - Comercios insertados/actualizados (id_comercio, id_bandera): {total_comercios_importados}")
+    print(f"  - Productos totales: {total_productos_final}")
     if total_errores > 0:
         print(f"  - Errores: {total_errores}")
     print(f"{'='*60}")
@@ -1,7 +1,14 @@
 """
 Módulo de configuración del proyecto
 """
-from .settings import DB_CONFIG, COMERCIOS_PERMITIDOS, API_KEY
-
-__all__ = ['DB_CONFIG', 'COMERCIOS_PERMITIDOS', 'API_KEY']
+from .settings import (DB_CONFIG, DB_POOL_MIN, DB_POOL_MAX, GUNICORN_THREADS,
+                       LOTE_VENTANA_MS, LOTE_MAXIMO, REDIS_URL, CACHE_TTL,
+                       IMPORT_WORK_MEM, IMPORT_MAINTENANCE_WORK_MEM,
+                       IMPORT_PARALLEL_WORKERS, SEPA_TMPDIR, COMERCIOS_PERMITIDOS,
+                       API_KEY)
 
+__all__ = ['DB_CONFIG', 'DB_POOL_MIN', 'DB_POOL_MAX', 'GUNICORN_THREADS',
+           'LOTE_VENTANA_MS', 'LOTE_MAXIMO', 'REDIS_URL', 'CACHE_TTL',
+           'IMPORT_WORK_MEM', 'IMPORT_MAINTENANCE_WORK_MEM',
+           'IMPORT_PARALLEL_WORKERS', 'SEPA_TMPDIR', 'COMERCIOS_PERMITIDOS',
+           'API_KEY']
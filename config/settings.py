@@ -15,10 +15,41 @@ DB_CONFIG = {
     'port': int(os.environ.get('DB_PORT', 5433)),
     'database': os.environ.get('DB_DATABASE', 'productos_sepa'),
     'user': os.environ.get('DB_USER', 'postgres'),
-    'password': os.environ.get('DB_PASSWORD', 'postgres')
+    'password': os.environ.get('DB_PASSWORD', 'postgres'),
+    # Keepalives TCP de libpq: las conexiones caídas se detectan en segundo
+    # plano y el pool las descarta, sin verificar su estado en cada consulta.
+    'keepalives': 1,
+    'keepalives_idle': int(os.environ.get('DB_KEEPALIVES_IDLE', 30)),
+    'keepalives_interval': int(os.environ.get('DB_KEEPALIVES_INTERVAL', 10)),
+    'keepalives_count': int(os.environ.get('DB_KEEPALIVES_COUNT', 3)),
+    'tcp_user_timeout': int(os.environ.get('DB_TCP_USER_TIMEOUT', 5000))
 }
 
-COMERCIOS_PERMITIDOS = [9, 12, 15, 10]
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 16))
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 5))
+# Cada thread de gunicorn usa su propia conexión: el pool nunca debe ser más
+# chico que la cantidad de threads, o las solicitudes fallarían con PoolError.
+DB_POOL_MAX = max(int(os.environ.get('DB_POOL_MAX', 25)), GUNICORN_THREADS)
+
+LOTE_VENTANA_MS = int(os.environ.get('LOTE_VENTANA_MS', 0))
+LOTE_MAXIMO = int(os.environ.get('LOTE_MAXIMO', 32))
+
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+
+# Parámetros de sesión de las conexiones del importador: memoria por operación
+# (deduplicación de staging), memoria para CREATE INDEX y workers paralelos.
+IMPORT_WORK_MEM = os.environ.get('IMPORT_WORK_MEM', '512MB')
+IMPORT_MAINTENANCE_WORK_MEM = os.environ.get('IMPORT_MAINTENANCE_WORK_MEM', '1GB')
+IMPORT_PARALLEL_WORKERS = int(os.environ.get('IMPORT_PARALLEL_WORKERS', 4))
+
+# Directorio donde se extrae el ZIP principal. Sin valor se usa /dev/shm
+# (en RAM) si tiene lugar suficiente, o el directorio temporal del sistema.
+SEPA_TMPDIR = os.environ.get('SEPA_TMPDIR')
+
+# frozenset: la pertenencia se chequea por cada fila importada.
+COMERCIOS_PERMITIDOS = frozenset({9, 12, 15, 10})
 
 api_key_raw = os.environ.get('API_KEY')
 API_KEY = api_key_raw.strip("'\"") if api_key_raw else None
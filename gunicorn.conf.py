@@ -0,0 +1,17 @@
+"""
+Configuración de gunicorn para la API REST.
+
+Usa workers gthread: cada worker atiende varias solicitudes en paralelo con
+threads, y cada thread toma su propia conexión del pool de BuscadorProductos.
+Como psycopg2 libera el GIL mientras espera a PostgreSQL, los threads dan
+concurrencia de I/O sin reescribir la API como ASGI. El pool se dimensiona
+para tener al menos una conexión por thread (ver config/settings.py).
+"""
+import multiprocessing
+import os
+from config import GUNICORN_THREADS
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2, 4)))
+worker_class = 'gthread'
+threads = GUNICORN_THREADS
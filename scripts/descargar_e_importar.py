@@ -13,6 +13,7 @@ import sys
 import os
 import logging
 import shutil
+import requests
 
 # Configurar logging
 logging.basicConfig(
@@ -36,6 +37,7 @@ os.chdir(project_root)
 
 from scripts.descargar_sepa import descargar_archivo_sepa, obtener_ruta_destino
 from app.services.importador import procesar_zip_sepa
+from config import API_KEY
 
 
 def limpiar_archivos_temporales(project_root_path):
@@ -65,6 +67,29 @@ def limpiar_archivos_temporales(project_root_path):
         logger.warning(f"Error al limpiar archivos temporales: {e}")
 
 
+def invalidar_cache_api():
+    """
+    Vacía la cache de productos de la API luego de una importación.
+
+    Sólo se ejecuta si la variable de entorno API_URL está configurada.
+    """
+    api_url = os.environ.get('API_URL')
+    if not api_url:
+        logger.info("API_URL no configurada, se omite la invalidación de cache")
+        return
+    
+    try:
+        response = requests.post(
+            f"{api_url.rstrip('/')}/api/v1/admin/flush",
+            headers={'Authorization': f'Bearer {API_KEY}'},
+            timeout=30
+        )
+        response.raise_for_status()
+        logger.info("Cache de la API invalidada")
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"No se pudo invalidar la cache de la API: {e}")
+
+
 def main():
     """
     Función principal: ejecuta descarga e importación.
@@ -101,6 +126,7 @@ def main():
         try:
             procesar_zip_sepa(ruta_archivo)
             logger.info("✓ Importación completada exitosamente")
+            invalidar_cache_api()
         except Exception as e:
             logger.error(f"ERROR en la importación: {e}")
             import traceback
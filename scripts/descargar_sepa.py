@@ -8,12 +8,26 @@ El archivo se guarda como 'sepa_data.zip' en la carpeta 'data/' o en la raíz.
 """
 import sys
 import os
+import json
+import shutil
+import argparse
+import atexit
+import time
+import hashlib
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
-import pytz
+from zoneinfo import ZoneInfo
+
+PROYECTO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CARPETA_DATA = os.path.join(PROYECTO_ROOT, 'data')
+RUTA_DESTINO = os.path.join(CARPETA_DATA if os.path.exists(CARPETA_DATA) else PROYECTO_ROOT,
+                            'sepa_data.zip')
 
 # Agregar el directorio raíz al path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROYECTO_ROOT)
 
 
 # URLs de descarga según el día de la semana
@@ -27,6 +41,42 @@ URLS_SEPA = {
     6: 'https://datos.produccion.gob.ar/dataset/6f47ec76-d1ce-4e34-a7e1-621fe9b1d0b5/resource/b3c3da5d-213d-41e7-8d74-f23fda0a3c30/download/sepa_sabado.zip',  # Sábado
 }
 
+# Sesión compartida: reutiliza la conexión a lo largo de las redirecciones del
+# portal y reintenta con backoff ante errores transitorios del servidor.
+SESSION = requests.Session()
+SESSION.headers['User-Agent'] = 'sepa_app/1.0.0'
+# El ZIP ya está comprimido: se pide sin gzip para que los bytes lleguen tal
+# cual al disco y Content-Length y los rangos se refieran al archivo real.
+SESSION.headers['Accept-Encoding'] = 'identity'
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504])
+))
+atexit.register(SESSION.close)
+
+# Sin ETag, un archivo local del mismo tamaño que el remoto se considera
+# actualizado si se descargó hace menos de este tiempo (en segundos).
+ANTIGUEDAD_MAXIMA_SIN_ETAG = 20 * 60 * 60
+
+# Descarga en paralelo por rangos (Range: bytes=a-b), una conexión por parte.
+# No supera el tamaño del pool de SESSION.
+PARTES_DESCARGA = 4
+TAMANO_MINIMO_RANGOS = 16 * 1024 * 1024
+
+# Bloques de 1 MiB por iteración y aviso de progreso cada 10 MiB.
+TAMANO_CHUNK = 1024 * 1024
+INTERVALO_PROGRESO = 10 * 1024 * 1024
+
+# Un solo worker: hay un único archivo por día y dos descargas simultáneas
+# escribirían el mismo '.part'.
+EXECUTOR_DESCARGA = ThreadPoolExecutor(max_workers=1)
+
+ZONA_ARGENTINA = ZoneInfo('America/Argentina/Buenos_Aires')
+
+# API de CKAN del portal: resource_show informa el hash de cada recurso.
+CKAN_RESOURCE_SHOW = 'https://datos.produccion.gob.ar/api/3/action/resource_show'
+
 NOMBRES_DIAS = {
     0: 'Domingo',
     1: 'Lunes',
@@ -45,50 +95,458 @@ def obtener_dia_argentina():
     Returns:
         int: Día de la semana (0=Domingo, 1=Lunes, ..., 6=Sábado)
     """
-    tz_argentina = pytz.timezone('America/Argentina/Buenos_Aires')
-    fecha_argentina = datetime.now(tz_argentina)
-    return fecha_argentina.weekday()
+    return datetime.now(ZONA_ARGENTINA).weekday()
 
 
 def obtener_ruta_destino():
     """
     Determina la ruta donde guardar el archivo descargado.
 
-    Prioriza la carpeta 'data/' si existe, sino usa la raíz del proyecto.
+    Prioriza la carpeta 'data/' si existe, sino usa la raíz del proyecto. La ruta
+    se resuelve una sola vez al importar el módulo (RUTA_DESTINO).
 
     Returns:
         str: Ruta completa donde guardar el archivo.
     """
-    proyecto_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    carpeta_data = os.path.join(proyecto_root, 'data')
+    return RUTA_DESTINO
+
+
+def cargar_metadatos(ruta_archivo):
+    """
+    Lee el ETag y Last-Modified guardados de la descarga anterior.
+
+    Los metadatos sólo sirven si el archivo descargado sigue existiendo.
+
+    Args:
+        ruta_archivo (str): Ruta del archivo descargado.
+
+    Returns:
+        dict: Diccionario con 'etag' y 'last_modified' (vacío si no hay datos).
+    """
+    ruta_meta = ruta_archivo + '.meta.json'
+    if not os.path.exists(ruta_archivo) or not os.path.exists(ruta_meta):
+        return {}
+    try:
+        with open(ruta_meta, 'r', encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError) as e:
+        print(f"[ADVERTENCIA] No se pudieron leer los metadatos de la descarga anterior: {e}")
+        return {}
+
+
+def guardar_metadatos(ruta_archivo, etag, last_modified, hash_ckan=None, blake2b=None):
+    """
+    Guarda el ETag y Last-Modified del archivo remoto junto al descargado.
+
+    Junto con el BLAKE2b se guardan el tamaño y la fecha de modificación del
+    archivo, para poder confiar en el digest sin recalcularlo mientras el
+    archivo no cambie (ver blake2b_vigente).
+
+    Args:
+        ruta_archivo (str): Ruta del archivo descargado.
+        etag (str): ETag informado por el servidor, o None.
+        last_modified (str): Last-Modified informado por el servidor, o None.
+        hash_ckan (str): Hash del recurso según la API de CKAN, o None.
+        blake2b (str): BLAKE2b por partes del archivo local (DigestPorPartes),
+            o None.
+    """
+    metadatos = {
+        'etag': etag,
+        'last_modified': last_modified,
+        'hash_ckan': hash_ckan,
+        'blake2b_partes': blake2b
+    }
+    try:
+        if blake2b:
+            estado = os.stat(ruta_archivo)
+            metadatos['tamano'] = estado.st_size
+            metadatos['mtime_ns'] = estado.st_mtime_ns
+        with open(ruta_archivo + '.meta.json', 'w', encoding='utf-8') as archivo:
+            json.dump(metadatos, archivo)
+    except OSError as e:
+        print(f"[ADVERTENCIA] No se pudieron guardar los metadatos de la descarga: {e}")
+
+
+def eliminar_archivo_parcial(ruta_parcial):
+    """
+    Elimina el archivo '.part' de una descarga fallida y sus metadatos.
+
+    Args:
+        ruta_parcial (str): Ruta del archivo parcial a eliminar.
+    """
+    for ruta in (ruta_parcial, ruta_parcial + '.meta.json'):
+        if os.path.exists(ruta):
+            try:
+                os.remove(ruta)
+                print(f"[INFO] Descarga incompleta eliminada: {ruta}")
+            except Exception as e:
+                print(f"[ERROR] No se pudo eliminar la descarga incompleta: {e}")
+
+
+def validador_parcial(ruta_parcial):
+    """
+    Devuelve el validador para retomar una descarga incompleta con If-Range.
+
+    Se usa el ETag con que se inició el '.part' (si no es débil, que If-Range
+    no admite) o en su defecto su Last-Modified.
+
+    Args:
+        ruta_parcial (str): Ruta del archivo parcial.
+
+    Returns:
+        str: Valor para el encabezado If-Range, o None si no se puede retomar.
+    """
+    metadatos = cargar_metadatos(ruta_parcial)
+    etag = metadatos.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return metadatos.get('last_modified')
+
+
+def limites_partes(tamaño_total):
+    """
+    Divide un archivo en PARTES_DESCARGA partes consecutivas.
+
+    Args:
+        tamaño_total (int): Tamaño del archivo en bytes.
+
+    Returns:
+        list: PARTES_DESCARGA + 1 posiciones; la parte i va de limites[i]
+            (inclusive) a limites[i + 1] (exclusive).
+    """
+    return [tamaño_total * i // PARTES_DESCARGA for i in range(PARTES_DESCARGA + 1)]
+
+
+class DigestPorPartes:
+    """
+    BLAKE2b (16 bytes) de un archivo calculado por partes.
+
+    Cada una de las partes de limites_partes tiene su propio BLAKE2b y el
+    digest final es el BLAKE2b de la concatenación de esos digests. Así se
+    puede calcular mientras se escribe el archivo, tanto en orden (descarga
+    secuencial, con actualizar) como por rangos en paralelo (cada worker de
+    descargar_por_rangos actualiza su elemento de partes), sin volver a leerlo
+    del disco al terminar.
+    """
     
-    if os.path.exists(carpeta_data):
-        return os.path.join(carpeta_data, 'sepa_data.zip')
-    else:
-        return os.path.join(proyecto_root, 'sepa_data.zip')
+    def __init__(self, tamaño_total):
+        """
+        Args:
+            tamaño_total (int): Tamaño final del archivo en bytes.
+        """
+        self.limites = limites_partes(tamaño_total)
+        self.partes = [hashlib.blake2b(digest_size=16) for _ in range(PARTES_DESCARGA)]
+        self._parte = 0
+        self._posicion = 0
+    
+    def actualizar(self, datos):
+        """
+        Agrega bytes consecutivos a partir de lo ya procesado.
 
+        Args:
+            datos (bytes): Bloque siguiente del archivo.
+        """
+        vista = memoryview(datos)
+        ultima = PARTES_DESCARGA - 1
+        while len(vista):
+            while self._parte < ultima and self._posicion >= self.limites[self._parte + 1]:
+                self._parte += 1
+            if self._parte < ultima:
+                cantidad = min(len(vista), self.limites[self._parte + 1] - self._posicion)
+            else:
+                cantidad = len(vista)
+            self.partes[self._parte].update(vista[:cantidad])
+            vista = vista[cantidad:]
+            self._posicion += cantidad
+    
+    def hexdigest(self):
+        """
+        Returns:
+            str: Digest final en hexadecimal.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for parte in self.partes:
+            digest.update(parte.digest())
+        return digest.hexdigest()
 
-def eliminar_archivo_viejo(ruta_archivo):
+
+class EscrituraConDigest:
+    """
+    Envuelve un archivo de modo que lo escrito actualice un DigestPorPartes.
+
+    Permite calcular el digest dentro de shutil.copyfileobj.
     """
-    Elimina el archivo anterior si existe.
+    
+    def __init__(self, archivo, digest):
+        self._archivo = archivo
+        self._digest = digest
+    
+    def write(self, datos):
+        self._digest.actualizar(datos)
+        return self._archivo.write(datos)
+
+
+def calcular_blake2b(ruta_archivo):
+    """
+    Calcula el BLAKE2b por partes (DigestPorPartes) de un archivo en disco.
 
     Args:
-        ruta_archivo (str): Ruta del archivo a eliminar.
+        ruta_archivo (str): Ruta del archivo.
+
+    Returns:
+        str: Digest en hexadecimal.
     """
-    if os.path.exists(ruta_archivo):
-        try:
-            os.remove(ruta_archivo)
-            print(f"[INFO] Archivo anterior eliminado: {ruta_archivo}")
-        except Exception as e:
-            print(f"[ERROR] No se pudo eliminar el archivo anterior: {e}")
+    digest = DigestPorPartes(os.path.getsize(ruta_archivo))
+    with open(ruta_archivo, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(TAMANO_CHUNK), b''):
+            digest.actualizar(bloque)
+    return digest.hexdigest()
+
+
+def blake2b_vigente(ruta_archivo, metadatos, verificar=False):
+    """
+    Devuelve el BLAKE2b del archivo local, recalculándolo sólo si hace falta.
+
+    Si el tamaño y la fecha de modificación coinciden con los guardados junto
+    al digest, se confía en el digest guardado sin leer el archivo. Si no, o
+    si se pide verificar, se recalcula.
+
+    Args:
+        ruta_archivo (str): Ruta del archivo descargado.
+        metadatos (dict): Metadatos guardados de la descarga anterior.
+        verificar (bool): Si se recalcula el digest aunque el archivo no
+            parezca modificado.
+
+    Returns:
+        str: Digest en hexadecimal.
+    """
+    if not verificar and metadatos.get('blake2b_partes'):
+        estado = os.stat(ruta_archivo)
+        if (estado.st_size == metadatos.get('tamano')
+                and estado.st_mtime_ns == metadatos.get('mtime_ns')):
+            return metadatos['blake2b_partes']
+    return calcular_blake2b(ruta_archivo)
+
+
+def obtener_hash_ckan(url):
+    """
+    Consulta el hash del recurso en la API de CKAN del portal.
+
+    El id del recurso se toma de la URL de descarga
+    (.../resource/<id>/download/...).
+
+    Args:
+        url (str): URL de descarga del recurso.
+
+    Returns:
+        str: Hash informado por CKAN, o None si no se pudo obtener o el
+            recurso no lo tiene cargado.
+    """
+    partes = url.split('/')
+    if 'resource' not in partes[:-1]:
+        return None
+    id_recurso = partes[partes.index('resource') + 1]
+    
+    try:
+        response = SESSION.get(CKAN_RESOURCE_SHOW, params={'id': id_recurso}, timeout=30)
+        response.raise_for_status()
+        return response.json()['result'].get('hash') or None
+    except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+        print(f"[ADVERTENCIA] No se pudo consultar el hash del recurso en CKAN: {e}")
+        return None
 
 
-def descargar_archivo_sepa():
+def actualizar_hash_ckan(ruta_archivo, metadatos, hash_ckan):
+    """
+    Registra el hash de CKAN de un archivo local que se confirmó vigente.
+
+    Así la próxima ejecución puede evitar el HEAD si el hash no cambia.
+
+    Args:
+        ruta_archivo (str): Ruta del archivo descargado.
+        metadatos (dict): Metadatos guardados de la descarga anterior.
+        hash_ckan (str): Hash actual del recurso en CKAN, o None.
+    """
+    if not hash_ckan or hash_ckan == metadatos.get('hash_ckan'):
+        return
+    guardar_metadatos(ruta_archivo, metadatos.get('etag'), metadatos.get('last_modified'),
+                      hash_ckan, blake2b_vigente(ruta_archivo, metadatos))
+
+
+def probar_cambios(url):
+    """
+    Consulta los encabezados del archivo remoto con un HEAD, sin descargarlo.
+
+    Args:
+        url (str): URL del archivo a consultar.
+
+    Returns:
+        tuple: (etag, last_modified, content_length, acepta_rangos), con None
+            en los datos que el servidor no informa. acepta_rangos es True si
+            el servidor anuncia Accept-Ranges: bytes.
+    """
+    response = SESSION.head(url, allow_redirects=True, timeout=30)
+    response.raise_for_status()
+    content_length = response.headers.get('Content-Length')
+    return (
+        response.headers.get('ETag'),
+        response.headers.get('Last-Modified'),
+        int(content_length) if content_length else None,
+        response.headers.get('Accept-Ranges') == 'bytes'
+    )
+
+
+def archivo_actualizado(ruta_archivo, metadatos, etag, content_length):
+    """
+    Determina si el archivo local ya coincide con el remoto.
+
+    Si el servidor informa ETag se compara con el de la descarga anterior. Si
+    no, se compara el tamaño (Content-Length) y se exige que el archivo local
+    tenga menos de ANTIGUEDAD_MAXIMA_SIN_ETAG.
+
+    Args:
+        ruta_archivo (str): Ruta del archivo descargado anteriormente.
+        metadatos (dict): Metadatos guardados de la descarga anterior.
+        etag (str): ETag remoto obtenido con probar_cambios, o None.
+        content_length (int): Tamaño remoto obtenido con probar_cambios, o None.
+
+    Returns:
+        bool: True si no hace falta volver a descargar el archivo.
+    """
+    if not os.path.exists(ruta_archivo):
+        return False
+    
+    if etag:
+        return etag == metadatos.get('etag')
+    
+    estado = os.stat(ruta_archivo)
+    return (content_length is not None and content_length == estado.st_size
+            and time.time() - estado.st_mtime < ANTIGUEDAD_MAXIMA_SIN_ETAG)
+
+
+def reservar_espacio(fd, tamaño_total):
+    """
+    Reserva de antemano el espacio en disco del archivo descargado.
+
+    Con posix_fallocate el sistema de archivos asigna extents contiguos de una
+    vez en lugar de ir extendiendo el archivo bloque a bloque. Si no está
+    disponible o el sistema de archivos no lo soporta (tmpfs, algunos NFS) se
+    continúa sin reservar.
+
+    Args:
+        fd (int): Descriptor del archivo destino.
+        tamaño_total (int): Tamaño final del archivo en bytes.
+    """
+    if not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd, 0, tamaño_total)
+    except OSError as e:
+        print(f"[ADVERTENCIA] No se pudo reservar espacio para la descarga: {e}")
+
+
+def descargar_rango(url, fd, inicio, fin, digest):
+    """
+    Descarga un rango de bytes del archivo y lo escribe en su posición.
+
+    Args:
+        url (str): URL del archivo remoto.
+        fd (int): Descriptor del archivo destino, ya con su tamaño final.
+        inicio (int): Primer byte del rango.
+        fin (int): Último byte del rango (inclusive).
+        digest: BLAKE2b de la parte (DigestPorPartes.partes), que se
+            actualiza con cada bloque recibido.
+
+    Returns:
+        bool: True si se descargó el rango, False si el servidor ignoró el
+            encabezado Range (respondió 200 con el archivo completo).
+
+    Raises:
+        requests.exceptions.RequestException: Si falla la descarga.
+        IOError: Si el servidor devuelve menos bytes que los pedidos o falla
+            la escritura.
+    """
+    response = SESSION.get(url, headers={'Range': f'bytes={inicio}-{fin}'}, stream=True, timeout=300)
+    with response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            return False
+        
+        posicion = inicio
+        for chunk in response.iter_content(chunk_size=TAMANO_CHUNK):
+            os.pwrite(fd, chunk, posicion)
+            digest.update(chunk)
+            posicion += len(chunk)
+    
+    if posicion != fin + 1:
+        raise IOError(f"Rango {inicio}-{fin} incompleto: se recibieron {posicion - inicio} bytes")
+    return True
+
+
+def descargar_por_rangos(url, ruta_parcial, tamaño_total, digest):
+    """
+    Descarga el archivo en PARTES_DESCARGA rangos en paralelo.
+
+    Cada parte usa su propia conexión y escribe con os.pwrite en su posición
+    del archivo, que se reserva y dimensiona de antemano al tamaño final.
+    Las partes son las de limites_partes, de modo que cada worker calcula el
+    BLAKE2b de la suya mientras la descarga.
+
+    Args:
+        url (str): URL del archivo remoto.
+        ruta_parcial (str): Ruta del archivo '.part' a escribir.
+        tamaño_total (int): Tamaño del archivo remoto en bytes.
+        digest (DigestPorPartes): Digest del archivo, creado con tamaño_total.
+
+    Returns:
+        bool: True si se descargaron todas las partes, False si el servidor
+            no respeta los rangos y hay que descargar de forma secuencial.
+    """
+    limites = digest.limites
+    
+    fd = os.open(ruta_parcial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        reservar_espacio(fd, tamaño_total)
+        os.ftruncate(fd, tamaño_total)
+        with ThreadPoolExecutor(max_workers=PARTES_DESCARGA) as executor:
+            futuros = [executor.submit(descargar_rango, url, fd, limites[i], limites[i + 1] - 1,
+                                       digest.partes[i])
+                       for i in range(PARTES_DESCARGA)]
+            resultados = [futuro.result() for futuro in futuros]
+    finally:
+        os.close(fd)
+    
+    return all(resultados)
+
+
+def descargar_archivo_sepa(mostrar_progreso=False, verificar=False):
     """
     Descarga el archivo ZIP del SEPA según el día de la semana actual.
 
     El archivo se guarda como 'sepa_data.zip' en la carpeta 'data/' o en la raíz.
-    Antes de descargar, elimina el archivo anterior si existe.
+    Si la API de CKAN informa el mismo hash del recurso que en la descarga
+    anterior y el archivo local sigue intacto (blake2b_vigente coincide con el
+    BLAKE2b guardado), se conserva sin más consultas. Si no, se consulta el archivo remoto con un
+    HEAD: si coincide con la descarga anterior (archivo_actualizado) se
+    conserva. Si el servidor acepta
+    rangos, el archivo se descarga en partes en paralelo; si no, con un GET
+    condicional con el ETag y Last-Modified anteriores, y un 304 indica que no
+    cambió. La descarga se escribe en un archivo '.part' que reemplaza al
+    anterior sólo al completarse, así un error no deja sin archivo. Si la
+    descarga secuencial se corta, el '.part' se conserva con lo recibido y la
+    próxima ejecución la retoma con Range e If-Range; el de una descarga por
+    rangos se elimina porque puede tener huecos.
+
+    La descarga secuencial copia la respuesta con shutil.copyfileobj, sin un
+    ciclo en Python por bloque; con mostrar_progreso se recorre por bloques
+    para informar el avance. En todos los casos el BLAKE2b se calcula a medida
+    que se escribe el archivo (al retomar, se lee sólo lo ya recibido).
+
+    Args:
+        mostrar_progreso (bool): Si se informa el progreso de la descarga
+            secuencial cada INTERVALO_PROGRESO bytes.
+        verificar (bool): Si se recalcula el BLAKE2b del archivo local aunque
+            su tamaño y fecha de modificación no hayan cambiado.
 
     Returns:
         bool: True si la descarga fue exitosa, False en caso contrario.
@@ -107,34 +565,162 @@ def descargar_archivo_sepa():
     print(f"[INFO] URL de descarga: {url}")
     print(f"[INFO] Destino: {ruta_destino}")
     
-    # Eliminar archivo anterior
-    eliminar_archivo_viejo(ruta_destino)
+    metadatos = cargar_metadatos(ruta_destino)
+    
+    # Si CKAN informa el mismo hash que en la descarga anterior y el archivo
+    # local sigue intacto, no hace falta consultar ni descargar el archivo.
+    hash_ckan = obtener_hash_ckan(url)
+    if hash_ckan and hash_ckan == metadatos.get('hash_ckan') and metadatos.get('blake2b_partes'):
+        if metadatos['blake2b_partes'] == blake2b_vigente(ruta_destino, metadatos, verificar):
+            # Registra el tamaño y la fecha actuales para no volver a
+            # recalcular el digest en la próxima ejecución.
+            guardar_metadatos(ruta_destino, metadatos.get('etag'), metadatos.get('last_modified'),
+                              hash_ckan, metadatos['blake2b_partes'])
+            print(f"[INFO] Archivo ya actualizado (hash de CKAN sin cambios): {ruta_destino}")
+            return True
+        print(f"[ADVERTENCIA] El archivo local no coincide con su BLAKE2b, se descarga de nuevo")
+        os.remove(ruta_destino)
+        metadatos = {}
+    
+    try:
+        etag, last_modified, content_length, acepta_rangos = probar_cambios(url)
+    except requests.exceptions.RequestException as e:
+        print(f"[ADVERTENCIA] No se pudo consultar el archivo remoto: {e}")
+        etag, last_modified, content_length, acepta_rangos = None, None, None, False
+    
+    if archivo_actualizado(ruta_destino, metadatos, etag, content_length):
+        print(f"[INFO] Archivo ya actualizado: {ruta_destino}")
+        actualizar_hash_ckan(ruta_destino, metadatos, hash_ckan)
+        return True
+    
+    ruta_parcial = ruta_destino + '.part'
+    
+    # Una descarga secuencial cortada en una ejecución anterior se retoma
+    # desde donde quedó, siempre que se conozca la versión que se bajaba.
+    parcial = os.path.getsize(ruta_parcial) if os.path.exists(ruta_parcial) else 0
+    validador = validador_parcial(ruta_parcial) if parcial else None
+    if parcial and not validador:
+        eliminar_archivo_parcial(ruta_parcial)
+        parcial = 0
+    
+    if not parcial and acepta_rangos and content_length and content_length >= TAMANO_MINIMO_RANGOS and hasattr(os, 'pwrite'):
+        try:
+            print(f"[INFO] Descargando {content_length / (1024 * 1024):.2f} MB en {PARTES_DESCARGA} partes...")
+            digest = DigestPorPartes(content_length)
+            if descargar_por_rangos(url, ruta_parcial, content_length, digest):
+                os.replace(ruta_parcial, ruta_destino)
+                guardar_metadatos(ruta_destino, etag, last_modified, hash_ckan, digest.hexdigest())
+                print(f"[INFO] Descarga completada exitosamente: {content_length / (1024 * 1024):.2f} MB")
+                print(f"[INFO] Archivo guardado en: {ruta_destino}")
+                return True
+            print(f"[INFO] El servidor no respeta los rangos, se descarga de forma secuencial")
+        except requests.exceptions.RequestException as e:
+            print(f"[ERROR] Error al descargar el archivo: {e}")
+            eliminar_archivo_parcial(ruta_parcial)
+            return False
+        except Exception as e:
+            print(f"[ERROR] Error inesperado: {e}")
+            eliminar_archivo_parcial(ruta_parcial)
+            return False
+    
+    headers = {}
+    if parcial:
+        # Con If-Range el servidor responde 200 con el archivo completo si
+        # cambió desde que se empezó el '.part'.
+        headers['Range'] = f'bytes={parcial}-'
+        headers['If-Range'] = validador
+    else:
+        if metadatos.get('etag'):
+            headers['If-None-Match'] = metadatos['etag']
+        if metadatos.get('last_modified'):
+            headers['If-Modified-Since'] = metadatos['last_modified']
     
     try:
         print(f"[INFO] Iniciando descarga...")
-        response = requests.get(url, stream=True, timeout=300)
+        response = SESSION.get(url, headers=headers, stream=True, timeout=300)
+        
+        if response.status_code == 304:
+            print(f"[INFO] El archivo no cambió desde la última descarga, se conserva: {ruta_destino}")
+            actualizar_hash_ckan(ruta_destino, metadatos, hash_ckan)
+            return True
+        
+        if response.status_code == 416:
+            # El '.part' no corresponde a un rango válido del archivo actual.
+            response.close()
+            eliminar_archivo_parcial(ruta_parcial)
+            parcial = 0
+            response = SESSION.get(url, stream=True, timeout=300)
+        
         response.raise_for_status()
         
         # Obtener tamaño del archivo si está disponible
         tamaño_total = int(response.headers.get('content-length', 0))
+        
+        if parcial and response.status_code == 206:
+            if not response.headers.get('Content-Range', '').startswith(f'bytes {parcial}-'):
+                raise requests.exceptions.RequestException(
+                    f"Content-Range inesperado al retomar la descarga: {response.headers.get('Content-Range')}")
+            print(f"[INFO] Retomando descarga desde {parcial / (1024 * 1024):.2f} MB")
+            tamaño_total += parcial
+            modo = 'r+b'
+        else:
+            parcial = 0
+            modo = 'wb'
+            guardar_metadatos(ruta_parcial, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        
         tamaño_mb = tamaño_total / (1024 * 1024) if tamaño_total > 0 else 0
         
         print(f"[INFO] Tamaño del archivo: {tamaño_mb:.2f} MB")
         
-        # Descargar archivo en chunks
-        descargado = 0
-        chunk_size = 8192
+        # Descargar archivo en chunks. Al retomar se escribe a partir de lo ya
+        # recibido (no en modo append: el espacio reservado extiende el archivo).
+        # Sin buffer de Python: cada bloque de 1 MiB va directo al kernel.
+        # Sin Content-Length no se conocen las partes del digest: se calcula
+        # leyendo el archivo al final.
+        digest = DigestPorPartes(tamaño_total) if tamaño_total > 0 else None
+        with open(ruta_parcial, modo, buffering=0) as archivo:
+            if digest is not None and parcial:
+                for bloque in iter(lambda: archivo.read(TAMANO_CHUNK), b''):
+                    digest.actualizar(bloque)
+            archivo.seek(parcial)
+            if tamaño_total > 0:
+                reservar_espacio(archivo.fileno(), tamaño_total)
+            try:
+                if mostrar_progreso:
+                    descargado = parcial
+                    proximo_aviso = INTERVALO_PROGRESO
+                    escribir = archivo.write
+                    informar = tamaño_total > 0
+                    actualizar_digest = digest.actualizar if digest is not None else None
+                    for chunk in response.iter_content(chunk_size=TAMANO_CHUNK):
+                        escribir(chunk)
+                        if actualizar_digest:
+                            actualizar_digest(chunk)
+                        descargado += len(chunk)
+                        
+                        if informar and descargado >= proximo_aviso:
+                            progreso = (descargado / tamaño_total) * 100
+                            print(f"[INFO] Progreso: {progreso:.1f}% ({descargado / (1024 * 1024):.2f} MB)")
+                            proximo_aviso += INTERVALO_PROGRESO
+                else:
+                    response.raw.decode_content = False
+                    destino = EscrituraConDigest(archivo, digest) if digest is not None else archivo
+                    shutil.copyfileobj(response.raw, destino, TAMANO_CHUNK)
+                
+                if tamaño_total > 0 and archivo.tell() != tamaño_total:
+                    raise IOError(f"Descarga incompleta: se escribieron {archivo.tell()} de {tamaño_total} bytes")
+            except BaseException:
+                # Se conserva sólo lo recibido (sin el espacio reservado) para
+                # poder retomar la descarga en la próxima ejecución.
+                archivo.truncate()
+                raise
         
-        with open(ruta_destino, 'wb') as archivo:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    archivo.write(chunk)
-                    descargado += len(chunk)
-                    
-                    # Mostrar progreso cada 10MB
-                    if tamaño_total > 0 and descargado % (10 * 1024 * 1024) < chunk_size:
-                        progreso = (descargado / tamaño_total) * 100
-                        print(f"[INFO] Progreso: {progreso:.1f}% ({descargado / (1024 * 1024):.2f} MB)")
+        metadatos_parcial = cargar_metadatos(ruta_parcial)
+        os.replace(ruta_parcial, ruta_destino)
+        if os.path.exists(ruta_parcial + '.meta.json'):
+            os.remove(ruta_parcial + '.meta.json')
+        guardar_metadatos(ruta_destino, metadatos_parcial.get('etag'), metadatos_parcial.get('last_modified'),
+                          hash_ckan, digest.hexdigest() if digest is not None else calcular_blake2b(ruta_destino))
         
         tamaño_final = os.path.getsize(ruta_destino) / (1024 * 1024)
         print(f"[INFO] Descarga completada exitosamente: {tamaño_final:.2f} MB")
@@ -150,15 +736,41 @@ def descargar_archivo_sepa():
         return False
 
 
+def descargar_async(mostrar_progreso=False, verificar=False):
+    """
+    Inicia la descarga del archivo SEPA en un thread en segundo plano.
+
+    Permite que quien llama haga otras tareas de preparación mientras se
+    descarga el archivo y espere el resultado recién cuando lo necesita.
+    Las descargas se ejecutan de a una (EXECUTOR_DESCARGA).
+
+    Args:
+        mostrar_progreso (bool): Se pasa a descargar_archivo_sepa.
+        verificar (bool): Se pasa a descargar_archivo_sepa.
+
+    Returns:
+        concurrent.futures.Future: Futuro cuyo resultado es el bool que
+            devuelve descargar_archivo_sepa.
+    """
+    return EXECUTOR_DESCARGA.submit(descargar_archivo_sepa, mostrar_progreso, verificar)
+
+
 def main():
     """
     Función principal del script de descarga.
     """
+    parser = argparse.ArgumentParser(description='Descarga el archivo ZIP del SEPA del día.')
+    parser.add_argument('--progress', action='store_true',
+                        help='Informar el progreso de la descarga cada 10 MB')
+    parser.add_argument('--verify', action='store_true',
+                        help='Recalcular el BLAKE2b del archivo local aunque no parezca modificado')
+    args = parser.parse_args()
+    
     print("=" * 70)
     print("Descargador de archivos SEPA")
     print("=" * 70)
     
-    exito = descargar_archivo_sepa()
+    exito = descargar_archivo_sepa(mostrar_progreso=args.progress, verificar=args.verify)
     
     if exito:
         print("\n[SUCCESS] Descarga completada exitosamente")